@@ -7,6 +7,54 @@ from solver_interfaces.solver_glpk import SolverGLPK; solver_instance = SolverGL
 # timeout for formulations (in seconds):
 timeout = 60
 # timeout = int(1e6)
+# share of the remaining time given to a cycle length when a shorter one can still be tried after it times out:
+fallback_time_share = 0.5
+# relative gap at which a solution found by the deadline is accepted instead of trying a shorter cycle length (None
+# accepts only optimal ones, and either way the best solution found is returned if the time runs out):
+anytime_gap = 0.005
+
+# cache parsed text instances in a binary sidecar file (<input>.cache.npz):
+instance_cache = True
+
+# cycle enumeration for the PC-TSP formulation, "serial" or "parallel" (forked worker processes):
+cycle_search = "serial"
+cycle_search_processes = None  # None uses all available cores
+# where the vertex lists of the enumerated cycles are kept, "memory" or "disk" (memory-mapped files, for pools where
+# the lists would not fit in RAM; the model still holds one variable and objective term per cycle):
+cycle_storage = "memory"
+cycle_storage_dir = None  # None uses the system temporary directory
+cycle_chunk_size = 1 << 22  # number of cycle vertices buffered before they are written to disk
+
+# remove vertices and edges that cannot be in any cycle or chain before building the formulation:
+reduce_graph = True
+
+# solve the weakly connected components of the compatibility graph as separate problems, in parallel processes that
+# share the cores out among the processes they fork themselves:
+decompose = True
+decompose_processes = None  # None uses all available cores
+
+# greedy and local-search solution offered to the solver as a start, and returned if the solver finds nothing better:
+warm_start_heuristic = True
+heuristic_cycle_length = 3  # longest cycles enumerated for it when the formulation does not enumerate cycles itself
+heuristic_time_share = 0.05  # share of the remaining time it may use
+# rounding of the fractional points seen in the cut callbacks into solutions offered to the solver as incumbents,
+# kept by the heuristic above when better than its own:
+callback_heuristic = True
+callback_heuristic_frequency = 10  # rounds the point of every this many callbacks
+callback_heuristic_time = 0.05  # seconds at most for every rounding, and at most heuristic_time_share of the remaining
+
+# large-neighborhood search ("lns" formulation), for pools too large to solve exactly:
+lns_neighborhood_size = 200  # vertices freed at first, adapted to how fast the subproblems solve
+lns_subproblem_time = 10  # seconds at most for every subproblem
+lns_processes = None  # None uses all available cores
+
+# cuts added from a callback that are not found violated again for this many separation rounds are forgotten by the
+# cut pool, and are added again if they are (None keeps them all):
+cut_pool_max_age = 50
+
+# JSON-lines file that receives every improving solution while solving, with its cycles and chains, objective, bound
+# and elapsed time (None to disable):
+progress_file = None
 
 # numerical precision:
 eps = 1e-6
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+binary_extension = ".npz"
+cache_suffix = ".cache" + binary_extension
+
+
+def file_hash(file_spec, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_spec, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_binary(file_spec):
+    return str(file_spec).endswith(binary_extension)
+
+
+def cache_path(file_spec):
+    return str(file_spec) + cache_suffix
+
+
+def save_instance(file_spec, root_nodes, paired_nodes, terminal_nodes, edges, problem_data, forbidden_nodes,
+                  source_hash=""):
+    origins, destinations, weights = edges
+    counts = [len(root_nodes), len(paired_nodes), len(terminal_nodes)]
+    tmp_spec = str(file_spec) + ".tmp"
+    with open(tmp_spec, "wb") as f:  # uncompressed, so loading is a plain buffer read
+        np.savez(
+            f,
+            node_names=np.array(root_nodes + paired_nodes + terminal_nodes, dtype=str),
+            node_counts=np.array(counts, dtype=np.int64),
+            origins=np.asarray(origins, dtype=np.int32),
+            destinations=np.asarray(destinations, dtype=np.int32),
+            weights=np.asarray(weights, dtype=float),
+            forbidden_nodes=np.array(forbidden_nodes, dtype=np.int32),
+            lengths=np.array([problem_data["max_chain_length"], problem_data["max_cycle_length"]], dtype=np.int64),
+            cycle_bonus=np.array(str(problem_data["cycle_bonus"])),
+            source_hash=np.array(source_hash),
+        )
+    os.replace(tmp_spec, file_spec)
+
+
+def load_instance(file_spec, source_hash=None):
+    with np.load(file_spec, allow_pickle=False) as data:
+        if source_hash is not None and str(data["source_hash"]) != source_hash:
+            return None
+        node_names = data["node_names"].tolist()
+        n_root, n_paired, n_terminal = data["node_counts"].tolist()
+        edges = data["origins"], data["destinations"], data["weights"]
+        max_chain_length, max_cycle_length = data["lengths"].tolist()
+        problem_data = {
+            "max_chain_length": max_chain_length,
+            "max_cycle_length": max_cycle_length,
+            "cycle_bonus": str(data["cycle_bonus"]),
+            "rootNodes": n_root,
+            "pairedNodes": n_paired,
+            "terminalNodes": n_terminal,
+        }
+        forbidden_nodes = data["forbidden_nodes"].tolist()
+    root_nodes = node_names[:n_root]
+    paired_nodes = node_names[n_root:n_root+n_paired]
+    terminal_nodes = node_names[n_root+n_paired:]
+    return root_nodes, paired_nodes, terminal_nodes, edges, problem_data, forbidden_nodes
+
+
+def convert(input_path, output_path):
+    from file_io.graph_io import parse_input
+    instance = parse_input(input_path)
+    save_instance(output_path, *instance, source_hash=file_hash(input_path))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    if len(args) != 3:
+        sys.exit("Usage: python -m file_io.binary_io <input path> <output path>")
+    convert(args[1], args[2])
+    print("Saved binary instance to file:", os.path.realpath(args[2]))
@@ -1,4 +1,5 @@
 import builtins
+import gzip
 import itertools
 import math
 import os
@@ -6,7 +7,10 @@ import os
 import igraph as ig
 import numpy as np
 
+from constants import instance_cache
+from file_io import binary_io
 from match import infinity
+from utils.edge_weights import EdgeWeights
 
 
 def no_print(*args):
@@ -20,32 +24,16 @@ def generate_graph(filespec, verbose=True):
         print = no_print
     print()
     print("Creating graph from file")
-    root_nodes, paired_nodes, terminal_nodes, edges, problem_data, forbidden_nodes = parse_input(filespec)
+    root_nodes, paired_nodes, terminal_nodes, edges, problem_data, forbidden_nodes = read_instance(filespec)
     ndds = list(range(len(root_nodes)))
 
     node_names = root_nodes + paired_nodes + terminal_nodes
     number_nodes = len(root_nodes) + len(paired_nodes) + len(terminal_nodes)
-
-    id_map = {
-        'r': 0,
-        'p': len(root_nodes),
-        't': len(root_nodes) + len(paired_nodes),
-    }
-    forbidden_nodes = [find_index(node, id_map) for node in forbidden_nodes]
     problem_data["forbiddenNodes"] = forbidden_nodes
 
-    graph = ig.Graph(directed=True)
-    graph.add_vertices(number_nodes)
-
-    weights = np.zeros((number_nodes, number_nodes), dtype=float)
-    ids_tuples = [None]*len(edges)
-    for i, e in enumerate(edges):
-        edge_id, origin, dest, edge_weight = e
-        o_id = find_index(origin, id_map)
-        d_id = find_index(dest, id_map)
-        ids_tuples[i] = (o_id, d_id)
-        weights[o_id, d_id] = float(edge_weight)
-    graph.add_edges(ids_tuples)
+    origins, destinations, edge_weights = edges
+    graph = ig.Graph(n=number_nodes, edges=np.column_stack((origins, destinations)).tolist(), directed=True)
+    weights = EdgeWeights(number_nodes, origins, destinations, edge_weights)
 
     print()
     if not verbose:
@@ -53,46 +41,83 @@ def generate_graph(filespec, verbose=True):
     return graph, weights, ndds, problem_data, node_names
 
 
-def parse_input(file_spec):
-    with open(file_spec) as f:
-        lines = f.readlines()
-        lines = list(map(str.strip, lines))
-    problem_data_dict, i = read_problem_data_dict(lines)
-    root_nodes, i = read_nodes(lines, i, "rootNodes")
-    paired_nodes, i = read_nodes(lines, i, "pairedNodes")
-    terminal_nodes, i = read_nodes(lines, i, "terminalNodes")
+def read_instance(file_spec):
+    if binary_io.is_binary(file_spec):
+        print("\tLoading binary instance")
+        return binary_io.load_instance(file_spec)
+    if not instance_cache:
+        return parse_input(file_spec)
+
+    cache_spec = binary_io.cache_path(file_spec)
+    source_hash = binary_io.file_hash(file_spec)
+    if os.path.isfile(cache_spec):
+        instance = binary_io.load_instance(cache_spec, source_hash)
+        if instance is not None:
+            print("\tLoaded cached instance", os.path.realpath(cache_spec))
+            return instance
+    instance = parse_input(file_spec)
     try:
-        forbidden_nodes, i = read_nodes(lines, i, "forbiddenNodes")
-    except AssertionError as _:
+        binary_io.save_instance(cache_spec, *instance, source_hash=source_hash)
+    except OSError as error:
+        print("\tCould not write instance cache:", error)
+    return instance
+
+
+def open_input(file_spec):
+    with open(file_spec, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(file_spec, "rt")
+    return open(file_spec)
+
+
+def parse_input(file_spec):
+    with open_input(file_spec) as f:
+        lines = map(str.strip, f)
+        problem_data_dict = read_problem_data_dict(lines)
+        root_nodes, header = read_nodes(lines, next(lines), "rootNodes")
+        paired_nodes, header = read_nodes(lines, header, "pairedNodes")
+        terminal_nodes, header = read_nodes(lines, header, "terminalNodes")
+        id_map = {
+            'r': 0,
+            'p': len(root_nodes),
+            't': len(root_nodes) + len(paired_nodes),
+        }
         forbidden_nodes = []
-    edges, i = read_edges(lines, i)
+        if str.lower(header).startswith("forbiddennodes,"):
+            forbidden_names, header = read_nodes(lines, header, "forbiddenNodes")
+            forbidden_nodes = [find_index(node, id_map) for node in forbidden_names]
+        edges = read_edges(lines, header, id_map)
     problem_data_dict["rootNodes"] = len(root_nodes)
     problem_data_dict["pairedNodes"] = len(paired_nodes)
     problem_data_dict["terminalNodes"] = len(terminal_nodes)
     return root_nodes, paired_nodes, terminal_nodes, edges, problem_data_dict, forbidden_nodes
 
 
-def read_nodes(nodes_list, line, str_format):
-    nodes = []
-    nodes_name, nodes_number = nodes_list[line].split(",")
-    end_list = line + int(nodes_number)
-    assert str.lower(nodes_list[end_list+1]) == str.lower("end" + str_format)
+def read_nodes(lines, header, str_format):
+    nodes_name, nodes_number = header.split(",")
+    assert str.lower(nodes_name) == str.lower(str_format)
     print_property(nodes_name, nodes_number)
-    for k in range(line, end_list):
-        nodes += [nodes_list[k+1]]
-    return nodes, end_list+2
+    nodes = list(itertools.islice(lines, int(nodes_number)))
+    assert str.lower(next(lines)) == str.lower("end" + str_format)
+    return nodes, next(lines)
 
 
-def read_edges(edges_list, line):
-    edges = []
-    edges_name, edges_number = edges_list[line].split(",")
+def read_edges(lines, header, id_map):
+    edges_name, edges_number = header.split(",")
     print_property(edges_name, edges_number)
-    end_list = line + int(edges_number)
     assert str.lower(edges_name) == "edges"
-    for k in range(line+1, end_list+1):
-        edges += [edges_list[k].split(",")]
-    assert str.lower(edges_list[end_list+1]) == "endedges"
-    return edges, end_list+2
+    number_edges = int(edges_number)
+    origins = np.empty(number_edges, dtype=np.int32)
+    destinations = np.empty(number_edges, dtype=np.int32)
+    weights = np.empty(number_edges, dtype=float)
+    for k, line in zip(range(number_edges), lines):
+        edge_id, origin, dest, edge_weight = line.split(",")
+        origins[k] = int(origin[1:]) + id_map[origin[0]] - 1
+        destinations[k] = int(dest[1:]) + id_map[dest[0]] - 1
+        weights[k] = float(edge_weight)
+    assert str.lower(next(lines)) == "endedges"
+    return origins, destinations, weights
 
 
 def print_property(name, number):
@@ -105,24 +130,25 @@ def find_index(node_name, id_map):
     return index
 
 
-def read_problem_data_dict(str_list):
+def read_problem_data_dict(lines):
     problem_data_dict = dict()
 
-    [chain_length_str, chain_length] = str_list[1].split(",")
+    next(lines)
+    [chain_length_str, chain_length] = next(lines).split(",")
     assert chain_length_str == "maxChainLength"
     problem_data_dict["max_chain_length"] = int(chain_length) if chain_length != "Infinity" else infinity
 
-    [cycle_length_str, cycle_length] = str_list[2].split(",")
+    [cycle_length_str, cycle_length] = next(lines).split(",")
     assert cycle_length_str == "maxCycleLength"
     problem_data_dict["max_cycle_length"] = int(cycle_length) if cycle_length != "Infinity" else infinity
 
-    cycle_bonus = str_list[3].split(",")
+    cycle_bonus = next(lines).split(",")
     assert cycle_bonus[0] == "cycleBonus"
     problem_data_dict["cycle_bonus"] = cycle_bonus[1]
 
-    assert str_list[4] == "endProblemData"
+    assert next(lines) == "endProblemData"
 
-    return problem_data_dict, 5
+    return problem_data_dict
 
 
 def sort_cycle(cycle, weights):
@@ -1,17 +1,22 @@
-import time
+import math
+
 import igraph as ig
+import numpy as np
 
-from constants import eps
+from constants import eps, warm_start_heuristic
 from formulations.formulation_abstract import Formulation
-from utils.graph_utils import find_recipients
-from utils.transport import Input, Output
-from utils.utils import get_remaining_time, setdiff
+from utils.constraint_matrix import ChainCopies, ConstraintMatrix, add_flow_rows, key_columns
+from utils.cut_pool import CutPool
+from utils.graph_utils import decode_successors, find_successors
+from utils.heuristic import Heuristic, best_output
+from utils.transport import Input, Output, matched_value
+from utils.utils import get_remaining_time, print_chain_pruning, setdiff
 
 
 class Basic(Formulation):
     def __init__(self, input_data: Input):
         self.solver_instance = input_data.solver_instance
-        self.start_time = time.perf_counter()
+        self.start_time = input_data.start_time
 
         self.m = self.solver_instance("basic")
         self.max_cycle_length = input_data.cycle_length
@@ -31,8 +36,19 @@ class Basic(Formulation):
         self.vertex_indices = [v.index for v in vertices]
 
         self.set_neighbors()
+        self.cut_pool = CutPool()
+        self.x_ndds = []
+        self.in_ndds = []
+        self.out_ndds = []
         self.set_lp()
         # self.m.set_callbacks(self.callback, lazy=True, cut=False)  # disabling this seems faster for CBC
+        self.progress = input_data.progress
+        if self.progress is not None:
+            self.m.set_incumbent_callback(self.report_incumbent)
+        self.heuristic = None
+        if warm_start_heuristic or input_data.start is not None:
+            self.heuristic = Heuristic(input_data)
+            self.set_heuristic_start()
         return
 
     def set_neighbors(self):
@@ -54,98 +70,93 @@ class Basic(Formulation):
             self.out_neighbors_tuples[orig] += [e]
 
     def set_lp(self):
+        # The constraints are gathered as blocks of a sparse matrix over the edge and vertex arrays and added at once.
+        n = self.n
+        edges = np.array(self.edge_tuples, dtype=np.int64).reshape(-1, 2)
+        origins, destinations = edges[:, 0], edges[:, 1]
+        n_edges = len(edges)
+        matrix = ConstraintMatrix()
+        self.matrix = matrix
+
         # print("Adding variables")
         self.x = self.m.add_vars(self.edge_tuples)
         self.y = self.m.add_vars(self.edge_tuples)
         self.z = self.m.add_vars(self.edge_tuples)
-
-        for e in self.edge_tuples:
-            self.m.add_constr_eq(self.x[e] + self.y[e] + -1*self.z[e], 0)
-
         self.in_flow = self.m.add_vars(self.vertex_indices)
         self.out_flow = self.m.add_vars(self.vertex_indices)
+        edge_columns, self.edge_keys = key_columns(origins*n + destinations)
+        self.x_first = matrix.add_columns(self.x)
+        self.y_first = matrix.add_columns(self.y)
+        z_first = matrix.add_columns(self.z)
+        self.in_first = matrix.add_columns(self.in_flow)
+        self.out_first = matrix.add_columns(self.out_flow)
+        x_columns = self.x_first + edge_columns
+        vertices = np.arange(n)
+
+        # every edge is a cycle edge, a chain edge or none: x + y = z
+        edge_rows = np.tile(np.arange(n_edges), 3)
+        matrix.add_rows(n_edges, edge_rows, np.concatenate((x_columns, self.y_first+edge_columns, z_first+edge_columns)),
+                        np.repeat([1., 1., -1.], n_edges), 0, 0)
 
         # print("Adding flow constraints")
-        for v in self.vertex_indices:
-            in_neighbors_vars = [self.x[e] for e in self.in_neighbors_tuples[v]]
-            out_neighbors_vars = [self.x[e] for e in self.out_neighbors_tuples[v]]
-            self.m.add_constr_eq(self.m.quick_sum(in_neighbors_vars) + self.in_flow[v] * -1, 0)
-            self.m.add_constr_eq(self.m.quick_sum(out_neighbors_vars) + self.out_flow[v] * -1, 0)
+        add_flow_rows(matrix, destinations, origins, x_columns, self.in_first+vertices, self.out_first+vertices)
 
         # print("Adding patient constraints")
         ndds = self.ndds
         self.patients = setdiff(self.vertex_indices, ndds)
-        for v in self.patients:
-            expr = self.out_flow[v] + -1*self.in_flow[v]
-            if v in self.forbidden_nodes:
-                self.m.add_constr_eq(expr, 0)
-            else:
-                self.m.add_constr_le(expr, 0)
+        patients = np.array(self.patients, dtype=np.int64)
+        forbidden = np.isin(patients, list(self.forbidden_nodes))
+        self.add_patient_rows(patients, np.where(forbidden, 0, -math.inf))
 
         # by default chains are unbounded
-        obj_terms = [0]*len(self.edge_tuples)
         if self.max_chain_length == 0 or len(ndds) == 0:  # no possible chains, add ad-hoc constraints
             self.cycle_fallback()
             self.set_y_zero()
         elif self.max_chain_length < self.n-1:  # bounded chains, add ad-hoc constraints and new chain variables/constraints
             self.cycle_fallback()
             self.set_ndd_constraints()
-            for e in self.edge_tuples:
-                edge_vars = [self.x_ndds[v][e] for v in ndds]
-                self.m.add_constr_eq(self.m.quick_sum(edge_vars) + -1*self.y[e], 0)
         else:
             self.set_y_zero()
+        matrix.add_to(self.m)
+        self.matrix = None
 
         # print("Setting objective")
-        obj_list = [self.z[t] * self.weights[t[0], t[1]] for t in self.edge_tuples if self.weights[t[0], t[1]] != 0]
+        obj_list = [self.z[t] * w for t, w in zip(self.edge_tuples, self.weights.values) if w != 0]
         self.m.set_objective_list(obj_list)
 
+    def add_patient_rows(self, patients, lower):
+        # lower <= out flow - in flow <= 0 for every patient
+        rows = np.arange(len(patients))
+        self.matrix.add_rows(len(patients), np.concatenate((rows, rows)),
+                             np.concatenate((self.out_first+patients, self.in_first+patients)),
+                             np.repeat([1., -1.], len(patients)), lower, 0)
+
     def set_y_zero(self):
-        for e in self.edge_tuples:
-            self.m.add_constr_eq(self.y[e], 0)
+        columns = self.y_first + np.arange(len(self.y))
+        self.matrix.add_rows(len(columns), np.arange(len(columns)), columns, 1, 0, 0)
 
     def cycle_fallback(self):
-        for p in self.patients:
-            self.m.add_constr_eq(self.out_flow[p] + -1*self.in_flow[p], 0)
-        for n in self.ndds:
-            self.m.add_constr_eq(self.out_flow[n], 0)
+        self.add_patient_rows(np.array(self.patients, dtype=np.int64), 0)
+        ndds = np.array(self.ndds, dtype=np.int64)
+        self.matrix.add_rows(len(ndds), np.arange(len(ndds)), self.out_first+ndds, 1, 0, 0)
 
     def set_ndd_constraints(self):
-        ndds = self.ndds
-
-        x_ndds = [None]*len(ndds)
-        in_ndds = [None]*len(ndds)
-        out_ndds = [None]*len(ndds)
-
-        for n in ndds:
-            x_ndds[n] = self.m.add_vars(self.edge_tuples)
-            in_ndds[n] = self.m.add_vars(self.vertex_indices)
-            out_ndds[n] = self.m.add_vars(self.vertex_indices)
+        matrix = self.matrix
+        copies = ChainCopies(self.m, matrix, self.n, self.out_neighbors, self.ndds, self.max_chain_length,
+                             self.forbidden_nodes, break_symmetry=True)
+        print_chain_pruning(len(copies.edge_columns), len(self.ndds)*len(self.edge_tuples))
 
-            for m in ndds:  # break symmetry of flows from NDDs
-                self.m.add_constr_eq(in_ndds[n][m], 0)
-                if m == n:
-                    continue
+        # a vertex is in one chain copy at most, or in a cycle, in rows 2v for its in flows and 2v+1 for its out flows
+        vertices = np.arange(self.n)
+        matrix.add_rows(2*self.n, np.concatenate((2*copies.vertices, 2*copies.vertices+1, 2*vertices, 2*vertices+1)),
+                        np.concatenate((copies.in_columns, copies.out_columns, self.in_first+vertices,
+                                        self.out_first+vertices)), 1, -math.inf, 1)
 
-            self.m.add_constr_le(self.m.quick_sum(x_ndds[n].values()), self.max_chain_length)
+        copies.add_edge_sums(matrix, self.edge_keys, self.y_first)  # the chain edges are the sums of their copies
 
-            for k in self.vertex_indices:
-                self.m.add_constr_eq(self.m.quick_sum([x_ndds[n][(i, k)] for i in self.in_neighbors[k]]) + -1*in_ndds[n][k], 0)
-                self.m.add_constr_eq(self.m.quick_sum([x_ndds[n][(k, j)] for j in self.out_neighbors[k]]) + -1*out_ndds[n][k], 0)
-            for p in self.patients:
-                expr = out_ndds[n][p] + -1*in_ndds[n][p]
-                if p in self.forbidden_nodes:
-                    self.m.add_constr_eq(expr, 0)
-                else:
-                    self.m.add_constr_le(expr, 0)
-
-        for k in self.vertex_indices:
-            in_flow_ndds = self.m.quick_sum([in_ndds[n][k] for n in ndds])
-            out_flow_ndds = self.m.quick_sum([out_ndds[n][k] for n in ndds])
-            self.m.add_constr_le(self.in_flow[k] + in_flow_ndds, 1)
-            self.m.add_constr_le(self.out_flow[k] + out_flow_ndds, 1)
-
-        self.x_ndds = x_ndds
+        self.x_ndds = copies.x_ndds
+        self.in_ndds = copies.in_ndds
+        self.out_ndds = copies.out_ndds
 
     def get_match_edges(self, callback=False, data=None):
         if callback:
@@ -170,6 +181,8 @@ class Basic(Formulation):
         optimal = False
         while found:
             self.add_cycle_constrs(cycles)
+            if cycles:
+                self.set_start(cycles)
 
             optimal = False
             remaining_time = get_remaining_time(self.start_time)
@@ -177,15 +190,64 @@ class Basic(Formulation):
                 # print("Re solving")
                 obj_val, optimal = self.m.solve(remaining_time)
             if not optimal:
-                return None
+                self.cut_pool.print_summary()
+                return self.get_incumbent_output()
             z_val = self.get_match_edges()
             found, cycles = self.check_cycle_lengths(z_val)
             # print(round(self.m.get_objective_value(), 5), cycles)
 
         # print("final solution:"); self.print_vars()
+        self.cut_pool.print_summary()
 
         return self.get_output(obj_val, optimal), self.__class__
 
+    def restrict_cycle_length(self, cycle_length: int, start_time: float) -> bool:
+        # The constraints added for cycles over the old limit still hold, the lazy loop cuts the ones in between.
+        self.max_cycle_length = cycle_length
+        self.start_time = start_time
+        return True
+
+    def set_start(self, cycles: list):
+        # The last solution without its cycles that are too long satisfies the new constraints, so the next solve
+        # starts from it instead of from nothing.
+        removed = {e for _, cycle in cycles for e in cycle}
+        x_val = self.start_values(self.x, removed)
+        for var in (self.x, self.y, self.z):
+            self.m.set_start(var, self.start_values(var, removed))
+        self.m.set_start(self.in_flow, {v: sum(x_val[e] for e in self.in_neighbors_tuples[v]) for v in self.in_flow})
+        self.m.set_start(self.out_flow, {v: sum(x_val[e] for e in self.out_neighbors_tuples[v]) for v in self.out_flow})
+        for x_ndd, in_ndd, out_ndd in zip(self.x_ndds, self.in_ndds, self.out_ndds):
+            x_ndd_val = self.start_values(x_ndd, removed)
+            self.m.set_start(x_ndd, x_ndd_val)
+            self.m.set_start(in_ndd, {v: sum(x_ndd_val.get(e, 0) for e in self.in_neighbors_tuples[v]) for v in in_ndd})
+            self.m.set_start(out_ndd, {v: sum(x_ndd_val.get(e, 0) for e in self.out_neighbors_tuples[v]) for v in out_ndd})
+
+    def set_heuristic_start(self):
+        # Chain edges go to y and the per-NDD copies when chains are bounded, and to x like cycle edges otherwise.
+        cycle_edges = self.heuristic.cycle_edge_set(self.max_cycle_length)
+        chains = self.heuristic.chain_edge_lists()
+        chain_pairs = {e for chain in chains.values() for e in chain}
+        x_val = dict.fromkeys(cycle_edges if self.x_ndds else cycle_edges | chain_pairs, 1)
+        self.m.set_start(self.x, x_val)
+        self.m.set_start(self.y, dict.fromkeys(chain_pairs if self.x_ndds else (), 1))
+        self.m.set_start(self.z, dict.fromkeys(cycle_edges | chain_pairs, 1))
+        self.m.set_start(self.in_flow, {v: sum(x_val.get(e, 0) for e in self.in_neighbors_tuples[v]) for v in self.in_flow})
+        self.m.set_start(self.out_flow, {v: sum(x_val.get(e, 0) for e in self.out_neighbors_tuples[v]) for v in self.out_flow})
+        for n, chain in chains.items():
+            if not self.x_ndds:
+                break
+            self.m.set_start(self.x_ndds[n], dict.fromkeys(chain, 1))
+            self.m.set_start(self.in_ndds[n], {v: 1 for _, v in chain})
+            self.m.set_start(self.out_ndds[n], {v: 1 for v, _ in chain})
+        if self.progress is not None:
+            self.progress.report(self.heuristic.output(self.max_cycle_length), self.graph, self.weights)
+
+    def start_values(self, var: dict, removed: set):
+        values = {key: round(value) for key, value in self.m.get_val(var).items()}
+        for e in removed.intersection(values):
+            values[e] = 0
+        return values
+
     def print_vars(self, callback=False, data=None):
         var_dict = {'x': self.x, 'y': self.y, 'z': self.z, 'out:': self.out_flow}
         for key, value in var_dict.items():
@@ -202,6 +264,34 @@ class Basic(Formulation):
         output = Output(match_edges, match_cycles, graph_cycles, value, optimal)
         return output
 
+    def get_incumbent_output(self):
+        # the best solution found by the deadline, or the heuristic one if it is better
+        output = None
+        bound = math.inf
+        if self.m.has_solution():
+            bound = self.m.get_bound()
+            output = self.repaired_output(self.m.get_val, bound)
+        output = best_output(output, self.heuristic, self.max_cycle_length, bound)
+        if output is None:
+            return None
+        return output, self.__class__
+
+    def report_incumbent(self, get_val, value, bound):
+        # repairing only lowers the value, so a point that does not beat the best one written is not decoded
+        if self.progress.improves(value):
+            self.progress.report(self.repaired_output(get_val, bound), self.graph, self.weights)
+
+    def repaired_output(self, get_val, bound):
+        # The solution read with get_val without its cycles over the length limit, which were not cut yet.
+        match_edges = {e: round(value) for e, value in get_val(self.z).items()}
+        _, cycles = self.check_cycle_lengths(match_edges)
+        for _, cycle in cycles:
+            for e in cycle:
+                match_edges[e] = 0
+        value = matched_value(match_edges, None, self.weights)
+        output = Output(match_edges, None, None, value, False, bound)
+        return output
+
     def callback(self, data):
         z_val = self.get_match_edges(callback=True, data=data)
         if z_val is None:
@@ -218,9 +308,12 @@ class Basic(Formulation):
         return found
 
     def add_cycle_constrs(self, cycles: list, callback=False, data=None):
+        self.cut_pool.next_round()
         for element in cycles:
             cycle_length = element[0]
             cycle = element[1]
+            if not self.cut_pool.add("cycle", cycle, cycle_length-1, callback):
+                continue
 
             cycle_vars = [self.z[e] for e in cycle]
             expr = self.m.quick_sum(cycle_vars)
@@ -230,29 +323,12 @@ class Basic(Formulation):
                 self.m.add_constr_le(expr, cycle_length-1)
 
     def check_cycle_lengths(self, x_val, early_stop=False):
-        n = self.n
-        flag = [False]*n
+        vertices, offsets, is_cycle = decode_successors(find_successors(self.n, x_val))
+        too_long = is_cycle & (np.diff(offsets) > self.max_cycle_length)
         cycles = []
-        recipients = find_recipients(self.graph, x_val)
-        for base in range(n):
-            if flag[base]:
-                continue
-            current_vertex = base
-            cycle_length = 0
-            cycle = []
-            while True:
-                flag[current_vertex] = True
-                next_vertex = recipients[current_vertex]
-                if next_vertex == -1:  # no recipient, end of a chain
-                    break
-                flag[next_vertex] = True
-                cycle += [(current_vertex, next_vertex)]
-                cycle_length += 1
-                if next_vertex == base:  # found the cycle
-                    if cycle_length > self.max_cycle_length:
-                        cycles += [(cycle_length, cycle)]
-                        if early_stop:
-                            return True, cycles
-                    break
-                current_vertex = next_vertex
+        for c in np.flatnonzero(too_long).tolist():
+            cycle = vertices[offsets[c]:offsets[c+1]].tolist()
+            cycles += [(len(cycle), list(zip(cycle, cycle[1:]+cycle[:1])))]
+            if early_stop:
+                break
         return len(cycles) > 0, cycles
@@ -0,0 +1,165 @@
+import copy
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from formulations.formulation_abstract import Formulation
+from utils.transport import Input, Output, get_match_list, merge_outputs, restrict_input
+from utils.utils import get_remaining_time, process_budget
+
+dt = 0.01
+handoff_time = 0.5  # seconds the processes stop before the deadline, to hand back the best solution they found
+handoff_share = 0.1  # at most this share of the remaining time
+
+
+class Decomposed(Formulation):
+    """Solves every weakly connected component of the compatibility graph as its own problem, in separate processes
+    sharing the time budget of the whole instance, and merges the solutions back into global vertex ids. A component
+    with nothing back by the deadline counts as unmatched, with a bound, and the merged solution is then not optimal.
+    The component solutions are kept, so that only the ones with cycles over a shorter cycle length, or not proven
+    optimal, are solved again."""
+
+    def __init__(self, input_data: Input, formulation, processes=None):
+        self.input_data = input_data
+        self.formulation = formulation
+        self.processes = process_budget(input_data, processes)
+        self.start_time = input_data.start_time
+        self.cycle_length = input_data.cycle_length
+        self.components = split_input(input_data)
+        self.procs = []
+        self.problems = None  # kept when solved in this process, to be solved again with a shorter cycle length
+        self.results = [None]*len(self.components)  # best result of every component at the current cycle length
+
+    def solve(self):
+        components = self.components
+        if len(components) <= 1:
+            if self.problems is None:
+                self.problems = [self.formulation(input_data) for _, input_data in components]
+            results = [problem.solve() for problem in self.problems]
+            if None in results:
+                return None
+            self.results = results
+            return self.merge()
+        pending = [c for c, result in enumerate(self.results) if result is None or not result[0].optimal]
+        print("Solving %s of %s independent components" % (len(pending), len(components)))
+
+        # every component process gets an equal share of the cores, for the processes it forks itself
+        component_processes = max(1, process_budget(self.input_data) // max(min(self.processes, len(pending)), 1))
+        result_queue = mp.Queue()
+        pending.sort(key=lambda c: len(components[c][0]))  # the largest are popped first
+        running = 0
+        while pending or running > 0:
+            while pending and running < self.processes:
+                c = pending.pop()
+                component_input = copy.copy(components[c][1])
+                component_input.cycle_length = self.cycle_length
+                component_input.start_time = handoff_start_time(self.start_time)
+                component_input.processes = component_processes
+                proc = mp.Process(target=solve_component, args=(c, self.formulation, component_input, result_queue))
+                proc.start()
+                self.procs.append(proc)
+                running += 1
+            while not result_queue.empty():  # before the clock is checked, so the results in time are all kept
+                c, result = result_queue.get()
+                self.keep(c, result)
+                running -= 1
+            if get_remaining_time(self.start_time) <= 0:
+                break
+            time.sleep(dt)
+        self.terminate_procs()
+        return self.merge()
+
+    def restrict_cycle_length(self, cycle_length: int, start_time: float) -> bool:
+        self.start_time = start_time
+        if len(self.components) <= 1:
+            if self.problems is None:
+                return False
+            return all([problem.restrict_cycle_length(cycle_length, start_time) for problem in self.problems])
+        # A component solution without longer cycles stays feasible, and optimal if it was, since a shorter cycle
+        # length only removes solutions, so only the other components are solved again.
+        self.cycle_length = cycle_length
+        for c, result in enumerate(self.results):
+            if result is not None and longest_cycle(result[0], self.components[c][1]) > cycle_length:
+                self.results[c] = None
+        return True
+
+    def keep(self, c, result):
+        # a result from a shorter cycle length replaces a kept one unless it is worse and neither is optimal
+        kept = self.results[c]
+        if result is None:
+            return
+        if kept is not None and not result[0].optimal and kept[0].value >= result[0].value:
+            kept[0].bound = min(kept[0].bound, result[0].bound)
+            return
+        self.results[c] = result
+
+    def merge(self):
+        formulations = set()
+        parts = []
+        for (members, input_data), result in zip(self.components, self.results):
+            if result is None:  # nothing back by the deadline, so unmatched with the bound of any matching
+                parts.append((members, Output(dict(), None, None, 0, False, matching_bound(input_data))))
+                continue
+            output, formulation = result
+            formulations.add(formulation)
+            parts.append((members, output))
+        formulation = formulations.pop() if len(formulations) == 1 else self.__class__
+        return merge_outputs(parts, self.input_data), formulation
+
+    def terminate_procs(self):
+        for p in self.procs:
+            p.terminate()
+            p.join()
+        self.procs = []
+
+
+def handoff_start_time(start_time):
+    return start_time - min(handoff_time, handoff_share*get_remaining_time(start_time))
+
+
+def solve_component(c, formulation, input_data: Input, result_queue: mp.Queue):
+    result = None
+    try:
+        result = formulation(input_data).solve()
+    finally:
+        result_queue.put((c, result))
+
+
+def longest_cycle(output: Output, input_data: Input):
+    lengths = [len(vertices) for kind, vertices, _ in get_match_list(output, input_data.graph, input_data.weights)
+               if kind == "cycle"]
+    return max(lengths, default=0)
+
+
+def matching_bound(input_data: Input):
+    # every vertex receives at most one matched edge, so no matching is worth more than the best edges into them
+    weights = input_data.weights
+    best = np.zeros(input_data.graph.vcount())
+    np.maximum.at(best, weights.destinations, np.maximum(weights.values, 0))
+    return float(best.sum())
+
+
+def split_input(input_data: Input):
+    # Components without edges cannot take part in any exchange and are left out.
+    graph = input_data.graph
+    weights = input_data.weights
+    n = graph.vcount()
+    membership = np.array(graph.connected_components(mode="weak").membership, dtype=np.int64).reshape(-1)
+    has_edges = np.bincount(membership[weights.origins], minlength=membership.max(initial=-1)+1) > 0
+    is_ndd = np.zeros(n, dtype=bool)
+    is_ndd[input_data.ndds] = True
+
+    edge_order = np.argsort(membership[weights.origins], kind="stable")  # keeps the edges in id order
+    edge_bounds = np.searchsorted(membership[weights.origins][edge_order], np.arange(len(has_edges)+1))
+    vertex_order = np.lexsort((np.arange(n), ~is_ndd, membership))  # NDDs first inside every component
+    vertex_bounds = np.searchsorted(membership[vertex_order], np.arange(len(has_edges)+1))
+
+    components = []
+    nonempty = np.flatnonzero(has_edges).tolist()
+    for c in nonempty:
+        members = vertex_order[vertex_bounds[c]:vertex_bounds[c+1]]
+        edge_ids = edge_order[edge_bounds[c]:edge_bounds[c+1]]
+        component = len(components) if len(nonempty) > 1 else None
+        components.append(restrict_input(input_data, members, edge_ids, component))
+    return components
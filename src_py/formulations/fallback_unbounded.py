@@ -26,12 +26,11 @@ class Unbounded(Formulation):
         loops = set()
         for i in range(n):
             weight_matrix[i, i] = 0
-        for e in self.graph.es():
+        for e, w in zip(self.graph.es(), self.input_data.weights.values):
             i = e.tuple[0]
             j = e.tuple[1]
             if i == j:
                 loops.add(i)
-            w = self.input_data.weights[i, j]
             weight_matrix[i, j] = -w
         ndds = self.input_data.ndds
         if self.has_chains:
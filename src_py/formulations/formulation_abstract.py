@@ -7,3 +7,8 @@ class Formulation(ABC):
     @abstractmethod
     def solve(self) -> {Output, None}:
         pass
+
+    def restrict_cycle_length(self, cycle_length: int, start_time: float) -> bool:
+        # Lowers the maximum cycle length of a formulation that was already solved, so that solve can be called again
+        # with the time budget starting at start_time. Returns False when it has to be built from scratch instead.
+        return False
@@ -1,18 +1,31 @@
 import math
+from collections import defaultdict
 
 import igraph as ig
+import numpy as np
 
-from constants import eps
+from constants import callback_heuristic, callback_heuristic_frequency, cycle_chunk_size, cycle_search, \
+    cycle_search_processes, cycle_storage, cycle_storage_dir, eps, warm_start_heuristic
 from formulations.formulation_abstract import Formulation
-from utils.graph_utils import simple_cycles_limited_length, simple_cycles_parallel
-from utils.transport import Input, Output
-from utils.utils import get_remaining_time, setdiff
+from utils.constraint_matrix import ChainCopies, ConstraintMatrix, add_flow_rows, key_columns
+from utils.cut_pool import CutPool
+from utils.cycle_store import CycleStore, CycleWriter
+from utils.graph_utils import CycleSearchStats, decode_successors, find_successors, simple_cycles_flat, \
+    simple_cycles_parallel
+from utils.heuristic import Heuristic, best_output, rounding_time
+from utils.transport import Input, Output, matched_value
+from utils.utils import get_remaining_time, print_chain_pruning, process_budget, setdiff
 
 
 class Intermediate(Formulation):
     def __init__(self, input_data: Input):
+        self.input_data = input_data
         self.start_time = input_data.start_time
         self.timed_out = False
+        self.built = False
+        self.heuristic = None
+        self.cut_pool = CutPool()
+        self.callbacks = 0
 
         self.m = input_data.solver_instance("basic")
         self.max_cycle_length = input_data.cycle_length
@@ -23,6 +36,10 @@ class Intermediate(Formulation):
         self.weights = input_data.weights
 
         self.forbidden_nodes = input_data.forbidden_nodes
+        self.progress = input_data.progress
+        self.x_ndds = []
+        self.in_ndds = []
+        self.out_ndds = []
 
         n = graph.vcount()
         self.n = n
@@ -33,13 +50,18 @@ class Intermediate(Formulation):
         self.set_neighbors()
 
     def solve(self):
-        self.prepare_cycles()
-        if self.timed_out:
-            return
+        if not self.built:
+            self.prepare_cycles()
+            if self.timed_out:
+                return
 
-        self.create_aux_graph()
-        self.set_lp()
-        self.m.set_callbacks(self.callback, lazy=True, cut=True)
+            self.set_lp()
+            self.create_aux_graph()
+            self.m.set_callbacks(self.callback, lazy=True, cut=True)
+            if self.progress is not None:
+                self.m.set_incumbent_callback(self.report_incumbent)
+            self.run_heuristic()
+            self.built = True
 
         obj_val = -1
         optimal = False
@@ -49,75 +71,107 @@ class Intermediate(Formulation):
             if remaining_time > 0.1:
                 obj_val, optimal = self.m.solve(remaining_time)
             if not optimal:
-                return None
+                self.cut_pool.print_summary()
+                return self.get_incumbent_output()
             # cuts_correct = True
             cuts_correct = self.check_cuts()
+            if not cuts_correct:
+                self.set_start()
+        self.cut_pool.print_summary()
         return self.get_output(obj_val, optimal), self.__class__
 
+    def restrict_cycle_length(self, cycle_length: int, start_time: float) -> bool:
+        # The enumerated cycles are kept, and the ones over the new limit are fixed out of the model.
+        if not self.built:
+            return False
+        print("Fixing out cycles longer than %s" % cycle_length)
+        self.fix_long_cycles(cycle_length)
+        self.max_cycle_length = cycle_length
+        self.start_time = start_time
+        return True
+
+    def fix_long_cycles(self, cycle_length: int):
+        self.m.set_ub([self.z[c] for c in (self.cycles.lengths > cycle_length).nonzero()[0].tolist()], 0)
+
     def set_lp(self):
+        # The constraints are gathered as blocks of a sparse matrix over the edge, vertex and cycle arrays and added at
+        # once, apart from the cycle rows of the patients, which are added in parts of at most cycle_chunk_size entries.
         n_cycles = len(self.cycles)
         ndds = self.ndds
         self.patients = setdiff(self.vertex_indices, ndds)
+        n = self.n
+        edges = np.array(self.edge_tuples, dtype=np.int64).reshape(-1, 2)
+        origins, destinations = edges[:, 0], edges[:, 1]
+        matrix = ConstraintMatrix()
 
         # print("Adding variables")
         self.x = self.m.add_vars(self.edge_tuples)
         self.in_flow = self.m.add_vars(self.vertex_indices)
         self.out_flow = self.m.add_vars(self.vertex_indices)
         self.z = self.m.add_vars(list(range(n_cycles)))
+        edge_columns, edge_keys = key_columns(origins*n + destinations)
+        x_first = matrix.add_columns(self.x)
+        in_first = matrix.add_columns(self.in_flow)
+        out_first = matrix.add_columns(self.out_flow)
+        z_first = matrix.add_columns(self.z)
+        x_columns = x_first + edge_columns
+        vertices = np.arange(n)
 
         # print("Adding patient constraints")
-        for k in self.patients:
-            expr = self.in_flow[k] + -1 * self.out_flow[k]
-            if k in self.forbidden_nodes:
-                self.m.add_constr_eq(expr, 0)
-            else:
-                self.m.add_constr_ge(expr, 0)
-            cycles_k = self.cycles_part_of[k]
-            var_list = [self.z[c] for c in cycles_k]
-            var_list.append(self.in_flow[k])
-            self.m.add_constr_le(self.m.quick_sum(var_list), 1)
+        self.add_patient_rows(matrix, np.array(self.patients, dtype=np.int64), in_first, out_first, z_first)
 
         # print("Adding NDD variables and constraints")
-        for n in ndds:
-            self.m.add_constr_eq(self.in_flow[n], 0)
+        ndd_array = np.array(ndds, dtype=np.int64)
+        matrix.add_rows(len(ndd_array), np.arange(len(ndd_array)), in_first+ndd_array, 1, 0, 0)
 
         if self.max_chain_length < self.n-1:  # bounded chains
-            x_ndds = [None]*len(ndds)
-            in_ndds = [None]*len(ndds)
-            out_ndds = [None]*len(ndds)
-            for n in ndds:
-                x_ndds[n] = self.m.add_vars(self.edge_tuples)
-                in_ndds[n] = self.m.add_vars(self.vertex_indices)
-                out_ndds[n] = self.m.add_vars(self.vertex_indices)
-
-                self.m.add_constr_le(self.m.quick_sum(x_ndds[n].values()), self.max_chain_length)
-                for k in self.vertex_indices:
-                    self.m.add_constr_eq(self.m.quick_sum([x_ndds[n][(i, k)] for i in self.in_neighbors[k]]) + -1*in_ndds[n][k], 0)
-                    self.m.add_constr_eq(self.m.quick_sum([x_ndds[n][(k, j)] for j in self.out_neighbors[k]]) + -1*out_ndds[n][k], 0)
-                for p in self.patients:
-                    self.m.add_constr_le(out_ndds[n][p] + -1*in_ndds[n][p], 0)
-            for e in self.edge_tuples:
-                self.m.add_constr_eq(self.m.quick_sum([x_ndds[n][e] for n in ndds]) + -1*self.x[e], 0)
+            copies = ChainCopies(self.m, matrix, n, self.out_neighbors, ndds, self.max_chain_length,
+                                 self.forbidden_nodes)
+            print_chain_pruning(len(copies.edge_columns), len(ndds)*len(self.edge_tuples))
+            self.x_ndds, self.in_ndds, self.out_ndds = copies.x_ndds, copies.in_ndds, copies.out_ndds
+            copies.add_edge_sums(matrix, edge_keys, x_first)
         elif len(ndds) == 0:
-            for e in self.edge_tuples:
-                self.m.add_constr_eq(self.x[e], 0)
+            matrix.add_rows(len(self.x), np.arange(len(self.x)), x_first+np.arange(len(self.x)), 1, 0, 0)
 
         # print("Setting objective and flow constraints")
-        obj_list = [None]*n_cycles
-        for c in range(n_cycles):
-            obj_list[c] = self.z[c] * self.cycle_weights[c]
+        # one term per cycle, so with disk storage the model is what grows in RAM with the number of cycles
+        obj_list = []
+        for start, end, _, _ in self.cycles.batches():
+            cycle_weights = self.cycles.weights[start:end].tolist()
+            obj_list += [self.z[c] * w for c, w in enumerate(cycle_weights, start)]
 
-        for k in self.vertex_indices:
-            expr_in = self.m.quick_sum([self.x[(i, k)] for i in self.in_neighbors[k]]) + -1*self.in_flow[k]
-            expr_out = self.m.quick_sum([self.x[(k, j)] for j in self.out_neighbors[k]]) + -1*self.out_flow[k]
-            self.m.add_constr_eq(expr_in, 0)
-            self.m.add_constr_eq(expr_out, 0)
-            for j in self.out_neighbors[k]:
-                obj_list.append(self.x[(k, j)] * self.weights[k, j])
+        add_flow_rows(matrix, destinations, origins, x_columns, in_first+vertices, out_first+vertices)
+        matrix.add_to(self.m)
+        for e, w in zip(self.edge_tuples, self.weights.values):
+            obj_list.append(self.x[e] * w)
 
         self.m.set_objective_list(obj_list)
         return
 
+    def add_patient_rows(self, matrix: ConstraintMatrix, patients, in_first, out_first, z_first):
+        # A patient only gives if it receives, or exactly then if it is forbidden to end a chain, and the cycles
+        # through it and its in flow add up to 1 at most. The cycle incidence may be memory-mapped, so it is read for a
+        # part of the patients at a time.
+        forbidden = np.isin(patients, list(self.forbidden_nodes))
+        indptr = self.cycles.incidence_indptr
+        counts = indptr[patients+1] - indptr[patients]
+        start = 0
+        while start < len(patients):
+            end = start + max(int(np.searchsorted(np.cumsum(counts[start:]), cycle_chunk_size, side="right")), 1)
+            part, part_counts = patients[start:end], counts[start:end]
+            offsets = indptr[part] - (np.cumsum(part_counts) - part_counts)
+            entries = np.arange(part_counts.sum()) + np.repeat(offsets, part_counts)
+            cycles = np.asarray(self.cycles.incidence_indices[entries], dtype=np.int64)
+            rows = 2*np.arange(len(part))
+            upper = np.where(forbidden[start:end], 0, math.inf)
+            matrix.add_rows(2*len(part), np.concatenate((rows, rows, np.repeat(rows+1, part_counts), rows+1)),
+                            np.concatenate((in_first+part, out_first+part, z_first+cycles, in_first+part)),
+                            np.concatenate((np.repeat([1., -1.], len(part)), np.ones(len(cycles)+len(part)))),
+                            np.stack((np.zeros(len(part)), np.full(len(part), -math.inf)), axis=1).reshape(-1),
+                            np.stack((upper, np.ones(len(part))), axis=1).reshape(-1))
+            matrix.add_to(self.m)
+            start = end
+
     def set_neighbors(self):
         n = self.n
 
@@ -142,44 +196,46 @@ class Intermediate(Formulation):
         print("Preparing cycles")
         remaining_time = get_remaining_time(self.start_time)
         max_cycle_length = min(self.max_cycle_length, self.n - len(self.ndds))
-        cycles = simple_cycles_limited_length(self.graph, max_cycle_length, remaining_time)
-        # cycles = simple_cycles_parallel(self.graph, max_cycle_length)
-        if cycles is None:
+        stats = CycleSearchStats(self.n)
+        writer = None
+        if cycle_storage == "disk":
+            writer = CycleWriter(cycle_storage_dir, cycle_chunk_size)
+        if cycle_search == "parallel":
+            result = simple_cycles_parallel(
+                self.graph, max_cycle_length, remaining_time, stats,
+                process_budget(self.input_data, cycle_search_processes), writer
+            )
+        else:
+            result = simple_cycles_flat(self.graph, max_cycle_length, remaining_time, stats, writer)
+        if result is None:
+            if writer is not None:
+                writer.discard()
             self.timed_out = True
             return
-        num_cycles = len(cycles)
-        print("Found %s cycles of length at most %s" % (num_cycles, max_cycle_length))
-        w = [0]*num_cycles
-        weights = self.weights
-        cycles_part_of = [[] for _ in range(self.n)]
-        for i, cycle in enumerate(cycles):
-            n = len(cycle)
-            w[i] = sum(weights[cycle[j], cycle[j+1]] for j in range(n-1))
-            w[i] += weights[cycle[n-1], cycle[0]]
-
-            for j in cycle:
-                cycles_part_of[j].append(i)
-        self.cycles = cycles
-        self.cycle_weights = w
-        self.cycles_part_of = cycles_part_of
+        files = writer.files if writer is not None else ()
+        self.cycles = CycleStore(self.n, *result, self.weights, writer is not None, cycle_storage_dir, files=files)
+        print("Found %s cycles of length at most %s" % (len(self.cycles), max_cycle_length))
+        print("Cycle search:", stats.summary())
 
     def create_aux_graph(self):
-        cb_graph = self.graph.copy()
-        caps = dict()
+        # The graph with a source n feeding every NDD and a sink n+1 fed by every patient. The capacities are kept in
+        # one list in edge id order, the x values of the edges of the graph followed by the source and sink edges, and
+        # only the entries that change are written between separations.
         n = self.n
-        cb_graph.add_vertex()
-        new_edges = [None]*len(self.ndds)
-        for j, i in enumerate(self.ndds):
-            new_edges[j] = (n, i)
-            caps[n, i] = 1
-            caps[i, n] = math.inf
-        cb_graph.add_edges(new_edges)
+        cb_graph = self.graph.copy()
+        cb_graph.add_vertices(2)
+        cb_graph.add_edges([(n, i) for i in self.ndds] + [(p, n+1) for p in self.patients])
         self.cb_graph = cb_graph
-        self.cb_tuples = [e.tuple for e in cb_graph.es]
-        self.added_sets = dict()
-        self.caps = caps
+        first_sink_edge = len(self.edge_tuples) + len(self.ndds)
+        self.sink_edges = dict(zip(self.patients, range(first_sink_edge, cb_graph.ecount())))
+        self.capacity = [0.]*len(self.edge_tuples) + [1.]*len(self.ndds) + [0.]*len(self.patients)
+        self.x_capacity = np.zeros(len(self.edge_tuples))
+        self.sink_targets = []
 
     def callback(self, data):
+        self.callbacks += 1
+        if callback_heuristic and self.heuristic is not None and self.callbacks % callback_heuristic_frequency == 0:
+            self.round_point(data)
         if len(self.ndds) == 0:
             return
         x_vals = self.m.callback.get_val(self.x, data)
@@ -191,10 +247,28 @@ class Intermediate(Formulation):
                 pos_index.append(i)
                 pos_values.append(in_vals[i])
         edges_sets = self.find_sets(x_vals, pos_index, pos_values)
+        self.cut_pool.next_round()
         for i, edges_set in edges_sets:
+            if not self.cut_pool.add(("in_flow", i), edges_set, 0, callback=True):
+                continue
             expr = self.m.quick_sum([self.x[e] for e in edges_set]) + -1*self.in_flow[i]
             self.m.callback.add_constr_ge(expr, 0, data)
 
+    def round_point(self, data):
+        # The point of the callback rounded by the heuristic, offered to the solver when it improves on the heuristic.
+        x_vals = self.m.callback.get_val(self.x, data)
+        z_vals = self.m.callback.get_val(self.z, data)
+        edge_values = np.array([x_vals[e] for e in self.edge_tuples], dtype=float)
+        cycle_values = np.array([z_vals[c] for c in range(len(self.cycles))], dtype=float)
+        if not self.heuristic.round_point(edge_values, cycle_values, rounding_time(self.start_time)):
+            return
+        lengths = self.cycles.lengths
+        z_val = {c: 1 for c in self.heuristic.cycle_ids if lengths[c] <= self.max_cycle_length}
+        self.start_from(self.heuristic.chain_edge_lists(), z_val,
+                        lambda collection, values: self.m.callback.set_solution(collection, values, data))
+        if self.progress is not None:
+            self.progress.report(self.heuristic.output(self.max_cycle_length), self.graph, self.weights)
+
     def check_cuts(self):
         if len(self.ndds) == 0:
             return True
@@ -207,38 +281,176 @@ class Intermediate(Formulation):
                 pos_index.append(i)
                 pos_values.append(in_vals[i])
         edges_sets = self.find_sets(x_vals, pos_index, pos_values)
+        self.cut_pool.next_round()
+        added = 0
         for i, edges_set in edges_sets:
+            if not self.cut_pool.add(("in_flow", i), edges_set, 0):
+                continue  # already a row of the model, violated only by the tolerances of the solver
             expr = self.m.quick_sum([self.x[e] for e in edges_set]) + -1*self.in_flow[i]
             self.m.add_constr_ge(expr, 0)
-        return len(edges_sets) == 0
+            added += 1
+        return added == 0
+
+    def ndd_chains(self, x_val):
+        # the chains of the solution that start at an NDD, edges not on them can only be cut off by new cuts
+        vertices, offsets, is_cycle = decode_successors(find_successors(self.n, x_val))
+        chains = {n: [] for n in self.ndds}
+        for s in np.flatnonzero(~is_cycle).tolist():
+            chain = vertices[offsets[s]:offsets[s+1]].tolist()
+            if chain[0] in chains:
+                chains[chain[0]] = list(zip(chain, chain[1:]))
+        return chains
+
+    def set_start(self):
+        # The chains of the last solution that start at an NDD, together with its cycles, are feasible, and the next
+        # solve starts from them.
+        chains = self.ndd_chains(self.m.get_val(self.x))
+        z_val = {c: round(value) for c, value in self.m.get_val(self.z).items()}
+        self.start_from(chains, z_val)
+
+    def heuristic_cycles(self):
+        # the enumerated cycles, so the cycle ids of the heuristic solution are the ones of the formulation
+        return self.cycles
+
+    def run_heuristic(self):
+        if not warm_start_heuristic and self.input_data.start is None:
+            return
+        self.heuristic = Heuristic(self.input_data, self.heuristic_cycles())
+        self.start_from(self.heuristic.chain_edge_lists(), dict.fromkeys(self.heuristic.cycle_ids, 1))
+        if self.progress is not None:
+            self.progress.report(self.heuristic.output(), self.graph, self.weights)
+
+    def start_from(self, chains: dict, z_val: dict, set_start=None):
+        # chains holds the edges of every chain by NDD, z_val the values of the cycle variables, and set_start takes
+        # the values of every variable, self.m.set_start by default
+        set_start = set_start or self.m.set_start
+        x_val = {e: 1 for chain in chains.values() for e in chain}
+        set_start(self.x, x_val)
+        set_start(self.in_flow, {v: sum(x_val.get((i, v), 0) for i in self.in_neighbors[v]) for v in self.in_flow})
+        set_start(self.out_flow, {v: sum(x_val.get((v, j), 0) for j in self.out_neighbors[v]) for v in self.out_flow})
+        set_start(self.z, z_val)
+        for n, chain in chains.items():
+            if not self.x_ndds:  # unbounded chains have no per-NDD copies
+                break
+            set_start(self.x_ndds[n], dict.fromkeys(chain, 1))
+            set_start(self.in_ndds[n], {v: 1 for _, v in chain})
+            set_start(self.out_ndds[n], {v: 1 for v, _ in chain})
 
     def find_sets(self, x_vals, nodes, in_vals):
-        n, ndds, graph, cb_graph, caps = self.n, self.ndds, self.graph, self.cb_graph, self.caps
-        edges_sets = []
-        for i in ndds:
-            x_vals[(n, i)] = 1
-        edge_tuples = self.cb_tuples
-        values = [x_vals[e] for e in edge_tuples]
-        cb_graph.es["capacity"] = values
-        for v, in_value in zip(nodes, in_vals):
-            mincut = cb_graph.mincut(n, v, "capacity")
-            flow = mincut.value
-            part2 = mincut[1]
-            if flow >= in_value-eps:
+        # Sets of vertices holding a patient v whose in-flow the x values cannot route from the NDDs, found in steps
+        # that get more expensive: the patients no NDD reaches on the support of x, which are all of them for integer
+        # values, then one max flow to the sink certifying every patient whose sink edge it saturates, and a min cut
+        # for each patient left. A cut found for v is also kept for the other patients in it that it separates.
+        n = self.n
+        x = np.array([x_vals[e] for e in self.edge_tuples], dtype=float).clip(0)
+        for i in np.flatnonzero(x != self.x_capacity).tolist():
+            self.capacity[i] = x[i]
+        self.x_capacity = x
+        targets = dict(zip(nodes, in_vals))
+
+        edges_sets, reached = self.unreached_sets(x, targets)
+        targets = {v: in_value for v, in_value in targets.items() if v in reached}
+        integral = ((x < eps) | (x > 1-eps)).all() and max(targets.values(), default=0) <= 1+eps
+        if not targets or integral:  # a path of edges at 1 carries the whole in-flow
+            return edges_sets
+
+        for v in self.sink_targets:
+            self.capacity[self.sink_edges[v]] = 0.
+        for v, in_value in targets.items():
+            self.capacity[self.sink_edges[v]] = in_value
+        self.sink_targets = list(targets)
+        flow = self.cb_graph.maxflow(n, n+1, self.capacity).flow
+        left = [v for v, in_value in targets.items() if flow[self.sink_edges[v]] < in_value-eps]
+
+        covered = set()
+        for v in left:
+            if v in covered:
                 continue
-            edges_set = []
-            for j in setdiff(part2, ndds):
-                in_neighbors = self.in_neighbors[j]
-                vec = setdiff(in_neighbors, part2)
-                for k in vec:
-                    edges_set.append((k, j))
-            edges_set.sort()  # to avoid repeating constraints
-            edges_sets.append((v, edges_set))
+            mincut = self.cb_graph.mincut(n, v, self.capacity)
+            if mincut.value >= targets[v]-eps:
+                continue
+            part2 = [j for j in mincut[1] if j < n]
+            edges_set = self.entering_edges(part2)
+            for u in part2:
+                if u in targets and u not in covered and mincut.value < targets[u]-eps:
+                    edges_sets.append((u, edges_set))
+                    covered.add(u)
         return edges_sets
 
-    def get_output(self, value, optimal):
-        match_edges = self.m.get_val(self.x)
-        match_cycles = self.m.get_val(self.z)
-        graph_cycles = self.cycles
+    def unreached_sets(self, x, targets):
+        # Patients that no NDD reaches on the edges with positive x get a cut of value 0, the weakly connected part of
+        # the support around them that no NDD reaches. Also returns the reached vertices.
+        support = np.flatnonzero(x > eps).tolist()
+        out_support = defaultdict(list)
+        linked = defaultdict(list)
+        for e in support:
+            i, j = self.edge_tuples[e]
+            out_support[i].append(j)
+            linked[i].append(j)
+            linked[j].append(i)
+        reached = set(self.ndds)
+        stack = list(self.ndds)
+        while stack:
+            for j in out_support[stack.pop()]:
+                if j not in reached:
+                    reached.add(j)
+                    stack.append(j)
+
+        edges_sets = []
+        seen = set()
+        for v in targets:
+            if v in reached or v in seen:
+                continue
+            part = {v}
+            stack = [v]
+            while stack:
+                for j in linked[stack.pop()]:
+                    if j not in part and j not in reached:
+                        part.add(j)
+                        stack.append(j)
+            seen |= part
+            edges_set = self.entering_edges(part)
+            edges_sets += [(u, edges_set) for u in part if u in targets]
+        return edges_sets, reached
+
+    def entering_edges(self, part):
+        part = set(part)
+        edges_set = [(k, j) for j in setdiff(part, self.ndds) for k in self.in_neighbors[j] if k not in part]
+        edges_set.sort()  # to avoid repeating constraints
+        return edges_set
+
+    def get_incumbent_output(self):
+        # the best solution found by the deadline, or the heuristic one if it is better
+        output = None
+        bound = math.inf
+        if self.m.has_solution():
+            bound = self.m.get_bound()
+            output = self.repaired_output(self.m.get_val, bound)
+        output = best_output(output, self.heuristic, self.max_cycle_length, bound)
+        if output is None:
+            return None
+        return output, self.__class__
+
+    def report_incumbent(self, get_val, value, bound):
+        # repairing only lowers the value, so a point that does not beat the best one written is not decoded
+        if self.progress.improves(value):
+            self.progress.report(self.repaired_output(get_val, bound), self.graph, self.weights)
+
+    def repaired_output(self, get_val, bound):
+        # The solution read with get_val, with the chains that start at an NDD and the cycles.
+        kept = {e for chain in self.ndd_chains(get_val(self.x)).values() for e in chain}
+        output = self.get_output(0, False, get_val)
+        output.match_edges = {e: float(e in kept) for e in output.match_edges}
+        output.value = matched_value(output.match_edges, output.graph_cycles, self.weights)
+        output.bound = bound
+        return output
+
+    def get_output(self, value, optimal, get_val=None):
+        get_val = get_val or self.m.get_val
+        match_edges = get_val(self.x)
+        z_vals = get_val(self.z)
+        chosen = [c for c, value in z_vals.items() if value > 1/2]
+        match_cycles = {i: z_vals[c] for i, c in enumerate(chosen)}
+        graph_cycles = self.cycles.subset(chosen, self.weights)  # only the chosen cycles leave the formulation
         output = Output(match_edges, match_cycles, graph_cycles, value, optimal)
         return output
@@ -0,0 +1,222 @@
+import copy
+import math
+import multiprocessing as mp
+import queue
+import random
+
+import numpy as np
+
+from constants import eps, lns_neighborhood_size, lns_processes, lns_subproblem_time
+from formulations.decomposed import handoff_start_time
+from formulations.formulation_abstract import Formulation
+from formulations.picef import PICEF
+from utils.graph_utils import adjacency_csr, neighbor_lists
+from utils.heuristic import Heuristic
+from utils.transport import Input, Output, get_match_list, matched_value, restrict_input
+from utils.utils import get_remaining_time, get_start_time, process_budget
+
+dt = 0.01
+neighborhoods = ["region", "chains", "cycles"]
+
+
+class LNS(Formulation):
+    """Large-neighborhood search for pools too large to solve exactly: starting from the heuristic solution, a
+    neighborhood of whole cycles and chains and the unmatched vertices around them is freed, and the subproblem over
+    its vertices is solved exactly with the sub formulation, starting from the freed cycles and chains, while the
+    rest of the solution stays fixed. A better subproblem solution replaces the freed cycles and chains. Several
+    processes search from the same start with different neighborhoods and random seeds, and the best solution by the
+    deadline is returned, never proven optimal. Problems no larger than a neighborhood are solved exactly instead."""
+
+    def __init__(self, input_data: Input, formulation=PICEF, processes=None):
+        self.input_data = input_data
+        self.formulation = formulation
+        self.processes = process_budget(input_data, processes or lns_processes)
+        self.start_time = input_data.start_time
+        self.procs = []
+
+    def solve(self):
+        input_data = self.input_data
+        if input_data.graph.vcount() <= lns_neighborhood_size:
+            return self.formulation(input_data).solve()
+        match_list = get_match_list(Heuristic(input_data).output(), input_data.graph, input_data.weights)
+        print("Large-neighborhood search in %s processes" % self.processes)
+        result_queue = mp.Queue()
+        worker_input = copy.copy(input_data)
+        worker_input.start_time = handoff_start_time(self.start_time)
+        worker_input.processes = max(1, process_budget(input_data) // self.processes)
+        for seed in range(self.processes):
+            search = Search(worker_input, self.formulation, seed, match_list)
+            proc = mp.Process(target=search.run, args=(result_queue,))
+            proc.start()
+            self.procs.append(proc)
+
+        # every process hands back its best solution when its time is up
+        result = None
+        received = 0
+        while received < self.processes and get_remaining_time(self.start_time) > 0:
+            try:
+                output = result_queue.get(timeout=dt)
+            except queue.Empty:
+                continue
+            received += 1
+            if output is not None and (result is None or output.value > result.value):
+                result = output
+        self.terminate_procs()
+        if result is None:
+            return None
+        return result, self.__class__
+
+    def terminate_procs(self):
+        for p in self.procs:
+            p.terminate()
+            p.join()
+        self.procs = []
+
+
+class Search:
+    """One search process: the current solution as cycles and chains of vertex lists, and the owner of every vertex,
+    the index of its cycle or chain or -1 when it is unmatched."""
+
+    def __init__(self, input_data: Input, formulation, seed, match_list):
+        self.progress = input_data.progress  # receives the whole solution, the subproblems report nothing
+        self.input_data = copy.copy(input_data)
+        self.input_data.progress = None
+        self.formulation = formulation
+        self.seed = seed
+        self.match_list = match_list
+        self.graph = input_data.graph
+        self.weights = input_data.weights
+        self.n = n = self.graph.vcount()
+        self.is_ndd = np.zeros(n, dtype=bool)
+        self.is_ndd[input_data.ndds] = True
+        self.size = lns_neighborhood_size
+        self.structures = []
+        self.owner = None
+        self.neighbors = None
+
+    def run(self, result_queue: mp.Queue):
+        output = None
+        try:
+            output = self.search()
+        finally:
+            result_queue.put(output)
+
+    def search(self):
+        random.seed(self.seed)
+        self.set_solution(self.match_list)
+        indptr, indices = adjacency_csr(self.graph)
+        out_neighs, in_neighs = neighbor_lists(self.n, indptr, indices)
+        self.neighbors = [out_neighs[v] + in_neighs[v] for v in range(self.n)]
+        value = self.value()
+
+        iteration = 0
+        while get_remaining_time(self.input_data.start_time) > 0.1:
+            kind = neighborhoods[(self.seed+iteration) % len(neighborhoods)]
+            iteration += 1
+            freed = self.neighborhood(kind)
+            freed_value = sum(self.structure_value(s) for s in set(self.owner[freed].tolist()) if s >= 0)
+            result, optimal = self.solve_subproblem(freed)
+            if result is None:
+                if not optimal:  # timed out before finding anything, try a smaller one
+                    self.size = max(int(self.size*0.8), 2)
+                continue
+            members, sub_input, output = result
+            if optimal and output.value <= freed_value + eps:
+                self.size = min(int(self.size*1.1)+1, self.n)  # nothing to gain here, look further next time
+                continue
+            if not optimal:
+                self.size = max(int(self.size*0.8), 2)
+            if output.value <= freed_value + eps:
+                continue
+            self.replace(freed, members, get_match_list(output, sub_input.graph, sub_input.weights))
+            value = self.value()
+            print("LNS %s: improved to %s with a %s neighborhood of %s vertices"
+                  % (self.seed, round(value, 5), kind, len(freed)))
+            if self.progress is not None:
+                self.progress.report(self.output(), self.graph, self.weights)
+        return self.output()
+
+    def set_solution(self, match_list):
+        self.structures = [(kind, vertices) for kind, vertices, _ in match_list]
+        self.owner = np.full(self.n, -1, dtype=np.int64)
+        for s, (_, vertices) in enumerate(self.structures):
+            self.owner[vertices] = s
+
+    def structure_value(self, s):
+        kind, vertices = self.structures[s]
+        edges = zip(vertices, vertices[1:]+vertices[:1] if kind == "cycle" else vertices[1:])
+        return sum(self.weights[e] for e in edges)
+
+    def value(self):
+        return sum(self.structure_value(s) for s in range(len(self.structures)))
+
+    def neighborhood(self, kind):
+        # vertices of whole cycles and chains, and unmatched ones, so the rest of the solution stays feasible
+        free = np.zeros(self.n, dtype=bool)
+        kinds = {"chains": "chain", "cycles": "cycle"}
+        seeds = [s for s, (k, _) in enumerate(self.structures) if k == kinds.get(kind)]
+        random.shuffle(seeds)
+        frontier = []
+        for s in seeds[:max(len(seeds)//4, 1)]:  # some random cycles or chains, then what is around them
+            vertices = self.structures[s][1]
+            free[vertices] = True
+            frontier += vertices
+            if len(frontier) >= self.size//2:
+                break
+        if not frontier:  # a region around a random vertex
+            v = random.randrange(self.n)
+            frontier = [v] if self.owner[v] < 0 else list(self.structures[self.owner[v]][1])
+            free[frontier] = True
+        count = len(frontier)
+        while frontier and count < self.size:
+            next_frontier = []
+            for v in frontier:
+                for w in self.neighbors[v]:
+                    if free[w] or count >= self.size:
+                        continue
+                    s = self.owner[w]
+                    added = [w] if s < 0 else self.structures[s][1]
+                    free[added] = True
+                    next_frontier += added
+                    count += len(added)
+            random.shuffle(next_frontier)
+            frontier = next_frontier
+        return np.flatnonzero(free)
+
+    def solve_subproblem(self, freed):
+        is_free = np.zeros(self.n, dtype=bool)
+        is_free[freed] = True
+        members = np.concatenate((freed[self.is_ndd[freed]], freed[~self.is_ndd[freed]]))  # NDDs first
+        edge_ids = np.flatnonzero(is_free[self.weights.origins] & is_free[self.weights.destinations])
+        if len(edge_ids) == 0:
+            return None, True
+        _, sub_input = restrict_input(self.input_data, members, edge_ids)
+        sub_input.start = self.restricted_solution(freed, members)  # instead of a new heuristic solution
+        time_limit = min(lns_subproblem_time, get_remaining_time(self.input_data.start_time))
+        sub_input.start_time = get_start_time(time_limit)
+        result = self.formulation(sub_input).solve()
+        if result is None:
+            return None, False
+        return (members, sub_input, result[0]), result[0].optimal
+
+    def restricted_solution(self, freed, members):
+        # the freed cycles and chains, in the vertex ids of the subproblem over members
+        position = np.full(self.n, -1, dtype=np.int64)
+        position[members] = np.arange(len(members))
+        freed_structures = sorted(s for s in set(self.owner[freed].tolist()) if s >= 0)
+        return [(kind, position[vertices].tolist()) for kind, vertices in (self.structures[s] for s in freed_structures)]
+
+    def replace(self, freed, members, match_list):
+        # the cycles and chains outside the neighborhood are kept, and the new ones inside it mapped back
+        freed_structures = set(self.owner[freed].tolist())
+        kept = [structure for s, structure in enumerate(self.structures) if s not in freed_structures]
+        new = [(kind, members[vertices].tolist()) for kind, vertices, _ in match_list]
+        self.set_solution([(kind, vertices, None) for kind, vertices in kept+new])
+
+    def output(self):
+        chosen = set()
+        for kind, vertices in self.structures:
+            chosen.update(zip(vertices, vertices[1:]+vertices[:1] if kind == "cycle" else vertices[1:]))
+        match_edges = {e.tuple: float(e.tuple in chosen) for e in self.graph.es}
+        value = matched_value(match_edges, None, self.weights)
+        return Output(match_edges, None, None, value, False, math.inf)  # no bound is known
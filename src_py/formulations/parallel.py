@@ -1,13 +1,18 @@
+import copy
 import multiprocessing as mp
+import queue
 import time
 
 from constants import timeout
 from formulations.basic import Basic
+from formulations.decomposed import handoff_start_time
 from formulations.fallback import Fallback
 from formulations.formulation_abstract import Formulation
 from formulations.intermediate import Intermediate
+from formulations.pief import PIEF
+from utils.utils import process_budget
 
-formulations_list = [Fallback, Basic, Intermediate]
+formulations_list = [Fallback, Basic, Intermediate, PIEF]
 n = len(formulations_list)
 
 dt = 0.01
@@ -17,26 +22,38 @@ class Parallel(Formulation):
     def __init__(self, *args):
         self.args = args
         self.procs = [None]*n
-        self.start_time = time.perf_counter()
+        self.start_time = args[0].start_time
 
     def solve(self):
         sol_queue = mp.Queue()
         finished_queue = mp.Queue(maxsize=n)
         procs = self.procs
+        input_data = copy.copy(self.args[0])
+        input_data.start_time = handoff_start_time(self.start_time)
+        input_data.processes = max(1, process_budget(input_data) // n)  # the formulations run side by side
+        args = (input_data,) + self.args[1:]
         for i, formulation in enumerate(formulations_list):
-            procs[i] = mp.Process(target=spawn, args=(formulation, self.args, sol_queue, finished_queue))
+            procs[i] = mp.Process(target=spawn, args=(formulation, args, sol_queue, finished_queue))
             procs[i].start()
 
+        # the first optimal solution wins, otherwise the best one handed back by the deadline
         result = None
         tf = self.start_time
         while tf - self.start_time < timeout:
             if not sol_queue.empty():
-                result = sol_queue.get()
-                break
+                result = best_result(result, sol_queue.get())
+                if result[0].optimal:
+                    break
+                continue
             if finished_queue.full():
                 break
             time.sleep(dt)
             tf = time.perf_counter()
+        while result is None or not result[0].optimal:
+            try:
+                result = best_result(result, sol_queue.get_nowait())
+            except queue.Empty:
+                break
         self.terminate_procs()
         return result
 
@@ -45,6 +62,12 @@ class Parallel(Formulation):
             p.terminate()
 
 
+def best_result(result, candidate):
+    if result is None or candidate[0].optimal or candidate[0].value > result[0].value:
+        return candidate
+    return result
+
+
 def spawn(formulation, args, sol_queue: mp.Queue, finished_queue: mp.Queue):
     name = formulation.__name__
     # print(name, "started")
@@ -53,5 +76,5 @@ def spawn(formulation, args, sol_queue: mp.Queue, finished_queue: mp.Queue):
     result = problem.solve()
     if result is not None:
         sol_queue.put(result)
-        print(name, "finished")
+        print(name, "finished" if result[0].optimal else "stopped at the deadline")
     finished_queue.put(formulation)
@@ -0,0 +1,140 @@
+from collections import defaultdict
+
+import numpy as np
+
+from formulations.intermediate import Intermediate
+from utils.graph_utils import chain_distances
+from utils.transport import Output, matched_value
+from utils.utils import get_remaining_time, setdiff
+
+
+class PICEF(Intermediate):
+    """Position-indexed chain-edge formulation: enumerated cycles as in Intermediate, and chains as edges indexed by
+    their position in the chain, so the model size does not depend on the number of NDDs."""
+
+    def solve(self):
+        if not self.built:
+            self.prepare_cycles()
+            if self.timed_out:
+                return
+
+            self.set_lp()
+            if self.progress is not None:
+                self.m.set_incumbent_callback(self.report_incumbent)
+            self.run_heuristic()
+            self.built = True
+
+        obj_val = -1
+        optimal = False
+        remaining_time = get_remaining_time(self.start_time)
+        if len(self.x) == 0 and len(self.cycle_vars) == 0:  # no cycles and no chains, solvers reject empty models
+            obj_val, optimal = 0, True
+        elif remaining_time > 0.1:
+            obj_val, optimal = self.m.solve(remaining_time)
+        if not optimal:
+            return self.get_incumbent_output()
+        return self.get_output(obj_val, optimal), self.__class__
+
+    def repaired_output(self, get_val, bound):
+        # chains and cycles are complete in the model, so every solution is feasible as is
+        output = self.get_output(0, False, get_val)
+        output.value = matched_value(output.match_edges, output.graph_cycles, self.weights)
+        output.bound = bound
+        return output
+
+    def set_lp(self):
+        ndds = self.ndds
+        is_ndd = set(ndds)
+        self.patients = setdiff(self.vertex_indices, ndds)
+        self.max_position = max_position = min(self.max_chain_length, len(self.patients)) if ndds else 0
+
+        # edges leaving an NDD only take the first position of a chain, and edges between patients the positions after
+        # the fewest hops from an NDD to their origin
+        ndd_mask = np.zeros(self.n, dtype=bool)
+        ndd_mask[ndds] = True
+        dist = chain_distances(self.graph, ndds, max_position, ndd_mask).tolist()
+        keys = []
+        for i, j in self.edge_tuples:
+            if j in is_ndd:
+                continue
+            positions = [1] if i in is_ndd else range(max(dist[i]+1, 2), max_position+1)
+            keys += [(i, j, k) for k in positions if k <= max_position]
+        self.x = self.m.add_vars(keys)
+        self.cycle_vars = self.set_cycle_vars()
+
+        in_vars = defaultdict(list)
+        out_vars = defaultdict(list)
+        for (i, j, k), var in self.x.items():
+            out_vars[i, k].append(var)
+            in_vars[j, k].append(var)
+
+        # print("Adding capacity constraints")
+        for v in self.vertex_indices:
+            var_list = self.cycle_vars_of(v)
+            if v in is_ndd:
+                var_list += out_vars[v, 1]
+            else:
+                for k in range(1, max_position+1):
+                    var_list += in_vars[v, k]
+            if var_list:
+                self.m.add_constr_le(self.m.quick_sum(var_list), 1)
+
+        # print("Adding chain position constraints")
+        for p in self.patients:
+            forbidden = p in self.forbidden_nodes
+            for k in range(1, max_position+1):
+                in_list = in_vars[p, k]
+                out_list = out_vars[p, k+1]
+                if not in_list and not out_list:
+                    continue
+                expr = self.m.quick_sum(out_list) + -1*self.m.quick_sum(in_list)
+                if forbidden:  # a forbidden patient cannot end a chain
+                    self.m.add_constr_eq(expr, 0)
+                elif out_list:
+                    self.m.add_constr_le(expr, 0)
+
+        # print("Setting objective")
+        edge_weights = dict(zip(self.edge_tuples, self.weights.values.tolist()))
+        obj_list = [var * edge_weights[i, j] for (i, j, _), var in self.x.items()]
+        obj_list += self.cycle_objective()
+        self.m.set_objective_list(obj_list)
+
+    def start_from(self, chains: dict, z_val: dict, set_start=None):
+        # the edge at position k of a chain sets its copy for that position
+        set_start = set_start or self.m.set_start
+        x_val = {(i, j, k): 1 for chain in chains.values() for k, (i, j) in enumerate(chain, 1)}
+        set_start(self.x, x_val)
+        self.set_cycle_start(z_val, set_start)
+
+    def set_cycle_start(self, z_val: dict, set_start):
+        set_start(self.z, z_val)
+
+    def set_cycle_vars(self):
+        self.z = self.m.add_vars(list(range(len(self.cycles))))
+        return self.z
+
+    def cycle_vars_of(self, v):
+        return [self.z[c] for c in self.cycles.cycles_of(v).tolist()]
+
+    def cycle_objective(self):
+        obj_list = []
+        for start, end, _, _ in self.cycles.batches():
+            cycle_weights = self.cycles.weights[start:end].tolist()
+            obj_list += [self.z[c] * w for c, w in enumerate(cycle_weights, start)]
+        return obj_list
+
+    def get_chain_edges(self, get_val):
+        match_edges = {e: 0 for e in self.edge_tuples}
+        for (i, j, _), x_val in get_val(self.x).items():
+            match_edges[i, j] += x_val
+        return match_edges
+
+    def get_output(self, value, optimal, get_val=None):
+        get_val = get_val or self.m.get_val
+        match_edges = self.get_chain_edges(get_val)
+        z_vals = get_val(self.z)
+        chosen = [c for c, value in z_vals.items() if value > 1/2]
+        match_cycles = {i: z_vals[c] for i, c in enumerate(chosen)}
+        graph_cycles = self.cycles.subset(chosen, self.weights)
+        output = Output(match_edges, match_cycles, graph_cycles, value, optimal)
+        return output
@@ -0,0 +1,109 @@
+import time
+from collections import defaultdict
+
+from formulations.picef import PICEF
+from utils.graph_utils import adjacency_csr, distances_to_root, neighbor_lists
+from utils.transport import Output
+from utils.utils import get_remaining_time
+
+
+class PIEF(PICEF):
+    """Position-indexed edge formulation: cycles as edges indexed by their position in the cycle and by the lowest
+    vertex of the cycle, so no cycles are enumerated and the model grows polynomially with the cycle length. Chains
+    are modelled as in PICEF."""
+
+    def prepare_cycles(self):
+        # Copy l of the graph holds the cycles whose lowest vertex is l. An edge (i, j) can only be at position k of
+        # such a cycle if i is at least k-1 edges away from l and j can get back to l in the remaining edges.
+        print("Preparing position-indexed cycle edges")
+        deadline = time.perf_counter()+get_remaining_time(self.start_time)
+        is_ndd = set(self.ndds)
+        max_length = min(self.max_cycle_length, self.n - len(self.ndds))
+        indptr, indices = adjacency_csr(self.graph)
+        out_neighs, in_neighs = neighbor_lists(self.n, indptr, indices)
+        out_neighs = [[] if v in is_ndd else [w for w in ws if w not in is_ndd] for v, ws in enumerate(out_neighs)]
+        in_neighs = [[] if v in is_ndd else [w for w in ws if w not in is_ndd] for v, ws in enumerate(in_neighs)]
+
+        keys = []
+        to_root = [max_length]*self.n
+        from_root = [max_length]*self.n
+        for root in range(self.n):
+            if time.perf_counter() > deadline:
+                self.timed_out = True
+                return
+            if root in is_ndd:
+                continue
+            reached_back = distances_to_root(root, max_length-1, in_neighs, to_root)
+            reached = distances_to_root(root, max_length-1, out_neighs, from_root)
+            for i in reached:
+                for j in out_neighs[i]:
+                    if j < root:
+                        continue
+                    first = 1 if i == root else from_root[i]+1
+                    last = max_length - (0 if j == root else to_root[j])
+                    if i == root:  # the lowest vertex is always the first donor
+                        last = min(last, 1)
+                    keys += [(root, i, j, k) for k in range(first, last+1)]
+            for v in reached_back:
+                to_root[v] = max_length
+            for v in reached:
+                from_root[v] = max_length
+        self.cycle_keys = keys
+        self.max_cycle_position = max_length
+        print("Created %s position-indexed cycle edges for cycles of length at most %s" % (len(keys), max_length))
+
+    def set_cycle_vars(self):
+        self.y = self.m.add_vars(self.cycle_keys)
+        self.y_in = defaultdict(list)
+        y_in_position = defaultdict(list)
+        y_out_position = defaultdict(list)
+        for (root, i, j, k), var in self.y.items():
+            self.y_in[j].append(var)
+            y_in_position[root, j, k].append(var)
+            y_out_position[root, i, k].append(var)
+
+        # print("Adding cycle position constraints")
+        roots = {root for root, _, _, _ in self.cycle_keys}
+        for root in roots:
+            closing = [var for k in range(1, self.max_cycle_position+1) for var in y_in_position[root, root, k]]
+            self.m.add_constr_eq(self.m.quick_sum(y_out_position[root, root, 1]) + -1*self.m.quick_sum(closing), 0)
+        positions = {(root, j, k) for root, j, k in y_in_position.keys() if j != root}
+        positions.update((root, i, k-1) for root, i, k in y_out_position.keys() if i != root)
+        for root, v, k in positions:  # what enters v at position k leaves it at position k+1
+            expr = self.m.quick_sum(y_in_position[root, v, k]) + -1*self.m.quick_sum(y_out_position[root, v, k+1])
+            self.m.add_constr_eq(expr, 0)
+        return self.y
+
+    def heuristic_cycles(self):
+        return None  # no cycles are enumerated, the heuristic enumerates short ones itself
+
+    def set_cycle_start(self, z_val: dict, set_start):
+        # a cycle starts at its lowest vertex, and its edges take the positions in order from there
+        y_val = dict()
+        for c in z_val:
+            cycle = self.heuristic.store.cycle(c)
+            first = cycle.index(min(cycle))
+            cycle = cycle[first:] + cycle[:first]
+            y_val.update(((cycle[0], i, j, k), 1) for k, (i, j) in enumerate(zip(cycle, cycle[1:]+cycle[:1]), 1))
+        set_start(self.y, y_val)
+
+    def fix_long_cycles(self, cycle_length: int):
+        # a cycle is longer than cycle_length exactly when it has an edge at a later position
+        self.m.set_ub([var for (_, _, _, k), var in self.y.items() if k > cycle_length], 0)
+
+    def cycle_vars_of(self, v):
+        return list(self.y_in[v])
+
+    def cycle_objective(self):
+        edge_weights = dict(zip(self.edge_tuples, self.weights.values.tolist()))
+        return [var * edge_weights[i, j] for (_, i, j, _), var in self.y.items()]
+
+    def get_output(self, value, optimal, get_val=None):
+        get_val = get_val or self.m.get_val
+        match_edges = self.get_chain_edges(get_val)
+        for (_, i, j, _), y_val in get_val(self.y).items():
+            match_edges[i, j] += y_val
+        match_cycles = None
+        graph_cycles = None
+        output = Output(match_edges, match_cycles, graph_cycles, value, optimal)
+        return output
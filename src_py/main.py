@@ -1,13 +1,15 @@
 from file_io import graph_io
 import sys
+import warnings
 
-from match import chain_cycle_match, get_match_list, get_formulation, print_options
+from constants import progress_file, solver_instance
+from match import chain_cycle_match, get_formulation, print_options
 
-# TODO: check if not repeating cuts speeds up solves
 # TODO: profile callbacks to make them faster
 # TODO: move to graph-tool and implement cycle search in C++
 
-from utils.transport import Input
+from utils.progress import Progress
+from utils.transport import Input, get_match_list
 
 
 def main(args):
@@ -38,6 +40,11 @@ def read_and_solve(input_path, objective_fn, max_cycle_length=None, max_chain_le
 
     forbidden_nodes = problem_data["forbiddenNodes"]
     input_data = Input(graph, weights, ndds, max_cycle_length, max_chain_length, forbidden_nodes)
+    if progress_file is not None:
+        input_data.progress = Progress(progress_file, node_names)
+        if not solver_instance.reports_incumbents():
+            warnings.warn(solver_instance.get_solver_name() + " cannot report the solutions it finds while solving, "
+                          "only the heuristic and final solutions go to the progress file", Warning, stacklevel=2)
     result = chain_cycle_match(input_data, objective_fn, decrease)
     if result is None:
         return None
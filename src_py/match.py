@@ -1,22 +1,26 @@
+import math
 import sys
 import time
 import warnings
 
-import igraph as ig
-import numpy as np
-
-from constants import timeout, solver_instance
+from constants import anytime_gap, decompose, decompose_processes, fallback_time_share, reduce_graph, timeout, solver_instance
+from formulations.decomposed import Decomposed
 from formulations.parallel import Parallel
 from formulations.basic import Basic
 from formulations.intermediate import Intermediate
+from formulations.picef import PICEF
+from formulations.pief import PIEF
 from formulations.fallback import Fallback
+from formulations.lns import LNS
 
-from utils.graph_utils import find_recipients
-from utils.transport import Output
+from utils.reduction import reduce_input
+from utils.transport import Output, merge_outputs
+from utils.utils import get_remaining_time, get_start_time
 
 infinity = int(sys.maxsize/2)
 warnings.simplefilter('always', Warning)
-formulations_dict = {"default": Parallel, "basic": Basic, "pctsp": Intermediate, "fallback": Fallback}
+formulations_dict = {"default": Parallel, "basic": Basic, "pctsp": Intermediate, "picef": PICEF, "pief": PIEF, "fallback": Fallback, "lns": LNS}
+anytime_formulations = (Fallback, LNS)  # these use the whole time limit, with no shorter cycle length to try after
 
 
 def get_formulation(objective_fn):
@@ -37,6 +41,13 @@ def chain_cycle_match(input_data, objective_fn, decrease=True, new_nodes=0, y=0)
     chain_length = input_data.chain_length
     if input_data.cycle_length == 0:
         input_data.cycle_length = 1
+    # all cycle lengths tried share one time budget, and a formulation that timed out is reused when it can be
+    t0 = time.perf_counter()
+    formulation = get_formulation(objective_fn)
+    problem = None
+    reduced = None
+    incumbent = None  # best solution found by a deadline that was not accepted, kept in case nothing better comes
+    incumbent_cycle_length = None
     while True:
         cycle_length = input_data.cycle_length
 
@@ -49,20 +60,42 @@ def chain_cycle_match(input_data, objective_fn, decrease=True, new_nodes=0, y=0)
             message = "Invalid cycle length, aborting"
             warnings.warn(message, Warning, stacklevel=sys.maxsize)
             time.sleep(0.5)
-            return None
+            result = incumbent
+            break
         print()
         print("Initializing and solving formulation")
-        t0 = time.perf_counter()
-        input_data.start_time = t0
-        formulation = get_formulation(objective_fn)
-        problem = formulation(input_data)
-        result = problem.solve()
+        remaining_time = get_remaining_time(t0)
+        if decrease and cycle_length > 1 and formulation not in anytime_formulations:
+            remaining_time *= fallback_time_share
+        input_data.start_time = get_start_time(remaining_time)
+        if problem is not None and problem.restrict_cycle_length(cycle_length, input_data.start_time):
+            result = problem.solve()
+        else:
+            reduced = reduce_input(input_data) if reduce_graph else None
+            problem_data = input_data if reduced is None else reduced[1]
+            problem = None
+            if problem_data.graph.ecount() == 0:  # nothing can be matched, and solvers reject empty models
+                result = Output(dict(), None, None, 0, True), formulation
+            else:
+                if decompose:
+                    problem = Decomposed(problem_data, formulation, decompose_processes)
+                else:
+                    problem = formulation(problem_data)
+                result = problem.solve()
+        if result is not None and reduced is not None:
+            result = merge_outputs([(reduced[0], result[0])], input_data), result[1]
+        if result is not None and not result[0].optimal:
+            if anytime_gap is not None and result[0].gap <= anytime_gap:
+                print("Accepting the solution found by the deadline, gap: %s%%" % round(100*result[0].gap, 3))
+            else:
+                if incumbent is None or result[0].value > incumbent[0].value:
+                    incumbent = result
+                    incumbent_cycle_length = cycle_length
+                result = None
         if result is None:
-            if not decrease:
-                return None
-
-            if formulation == Fallback:
-                return None
+            if not decrease or formulation in anytime_formulations or get_remaining_time(t0) <= 0:
+                result = incumbent
+                break
 
             input_data.cycle_length -= 1
             print()
@@ -71,62 +104,29 @@ def chain_cycle_match(input_data, objective_fn, decrease=True, new_nodes=0, y=0)
             time.sleep(0.5)
             print()
         else:
-            tf = time.perf_counter()
-            if new_nodes > 0:
-                postprocess_result(result[0], input_data.graph, new_nodes, y)
-            print()
-            print("Solution found")
-            print("Solution time:", round(tf-t0, 3), "seconds")
-            print()
-            print("Objective value: %s" % round(result[0].value, 5))
-            result[0].time = round(tf-t0, 7)
             break
+    if result is None:
+        return None
+    # the incumbent comes from a longer maximum cycle length, so it can hold cycles the shorter one forbids,
+    # but it still respects the maximum cycle length that was asked for
+    if incumbent is not None and incumbent[0].value > result[0].value:
+        result = incumbent
+    result_cycle_length = incumbent_cycle_length if result is incumbent else input_data.cycle_length
+
+    tf = time.perf_counter()
+    if new_nodes > 0:
+        postprocess_result(result[0], input_data.graph, new_nodes, y)
+    print()
+    print("Solution found" if result[0].optimal else "Solution found by the deadline, not proven optimal")
+    print("Solution time:", round(tf-t0, 3), "seconds")
+    print()
+    print("Objective value: %s" % round(result[0].value, 5))
+    print("Found with maximum cycle length:", get_str(result_cycle_length))
+    if not result[0].optimal and not math.isfinite(result[0].bound):
+        print("Bound: unknown")
+    elif not result[0].optimal:
+        print("Bound: %s (gap: %s%%)" % (round(result[0].bound, 5), round(100*result[0].gap, 3)))
+    result[0].time = round(tf-t0, 7)
+    if input_data.progress is not None:  # the whole matching, also when it was found in separate components
+        input_data.progress.report(result[0], input_data.graph, input_data.weights)
     return result
-
-
-def get_match_list(output_data: Output, graph: ig.Graph, weights: np.array):
-    match_edges = output_data.match_edges
-    match_cycles = output_data.match_cycles
-    graph_cycles = output_data.graph_cycles
-
-    n = graph.vcount()
-    cycle_chains_list = []
-    flag = [0]*n
-    recipients = find_recipients(graph, match_edges)
-    for base in range(n):
-        if flag[base] == 0:
-            current_vertex = base
-            cycle_chain_length = 0
-            cycle_chain = []
-            cycle_chain_weights = []
-            for k in range(n):
-                next_vertex = recipients[current_vertex]
-                if next_vertex == -1:  # no recipient, end of a chain
-                    if cycle_chain_length > 0:
-                        cycle_chain.append(current_vertex)
-                        cycle_chain_weights.append(0)
-                        cycle_chains_list.append(("chain", cycle_chain, cycle_chain_weights))
-                    break
-                if next_vertex == base:  # closed the cycle
-                    cycle_chain.append(current_vertex)
-                    cycle_chain_weights.append(weights[current_vertex, next_vertex])
-                    cycle_chains_list.append(("cycle", cycle_chain, cycle_chain_weights))
-                    break
-                cycle_chain.append(current_vertex)
-                cycle_chain_weights.append(weights[current_vertex, next_vertex])
-                flag[next_vertex] = 1
-                cycle_chain_length += 1
-                current_vertex = next_vertex
-    if match_cycles is not None:
-        num_cycles = len(graph_cycles)
-        for i in range(num_cycles):
-            if match_cycles[i] > 1/2:
-                cycle = graph_cycles[i]
-                c = len(cycle)
-                cycle_weights = [None]*c
-                for j in range(c):
-                    o = cycle[j]
-                    d = cycle[(j+1) % c]
-                    cycle_weights[j] = weights[o, d]
-                cycle_chains_list.append(("cycle", cycle, cycle_weights))
-    return cycle_chains_list
@@ -1,3 +1,4 @@
+import math
 from abc import ABC, abstractmethod
 
 
@@ -12,6 +13,12 @@ class AbstractSolver(ABC):
     def check_integrality():
         pass
 
+    @staticmethod
+    @abstractmethod
+    def reports_incumbents():
+        # whether set_incumbent_callback gets the solutions found while solving
+        pass
+
     @abstractmethod
     def add_vars(self, collection: {dict, list}):
         pass
@@ -32,6 +39,17 @@ class AbstractSolver(ABC):
     def add_constr_ge(self, expr, rhs: float):
         pass
 
+    @abstractmethod
+    def add_constr_matrix(self, variables: list, indptr, indices, data, lower, upper):
+        # rows lower <= sum of data * variables[indices] <= upper, one per row of the CSR matrix (indptr, indices, data),
+        # with -inf and inf for no bound
+        pass
+
+    @abstractmethod
+    def set_ub(self, var_list: list, ub: float):
+        # upper bound of the variables, which fixes binary ones to 0 without adding rows
+        pass
+
     @abstractmethod
     def add_sos_constr(self, var_list, weights):
         pass
@@ -41,6 +59,12 @@ class AbstractSolver(ABC):
     def quick_sum(var_list):
         pass
 
+    @abstractmethod
+    def set_start(self, collection: dict, values: dict):
+        # values of the variables in collection, by key, offered as a starting incumbent to the next solve, or ignored
+        # if the solver cannot take one for this model
+        pass
+
     @abstractmethod
     def solve(self, timeout: float):
         pass
@@ -49,6 +73,16 @@ class AbstractSolver(ABC):
     def get_objective_value(self):
         pass
 
+    @abstractmethod
+    def has_solution(self) -> bool:
+        # whether the last solve, optimal or not, left a feasible solution to read with get_val
+        pass
+
+    @abstractmethod
+    def get_bound(self) -> float:
+        # best bound on the objective proven by the last solve
+        pass
+
     @staticmethod
     @abstractmethod
     def get_val(collection) -> dict:
@@ -58,6 +92,13 @@ class AbstractSolver(ABC):
     def set_callbacks(self, function, lazy, cut):
         pass
 
+    @abstractmethod
+    def set_incumbent_callback(self, function):
+        # function(get_val, value, bound) is called for the integer solutions found while solving, with get_val reading
+        # their values like get_val does after a solve, their objective value, and the best bound at the time (inf if
+        # the solver does not tell)
+        pass
+
     @abstractmethod
     def get_n_vars(self):
         pass
@@ -71,6 +112,24 @@ class AbstractSolver(ABC):
         pass
 
 
+def row_senses(lower, upper):
+    # the sense "E", "G" or "L" and the right-hand side of every row, which must have at most one bound or equal ones
+    senses, rhs = [], []
+    for low, high in zip(lower.tolist(), upper.tolist()):
+        if low == high:
+            senses.append("E")
+            rhs.append(low)
+        elif high == math.inf and low > -math.inf:
+            senses.append("G")
+            rhs.append(low)
+        elif low == -math.inf and high < math.inf:
+            senses.append("L")
+            rhs.append(high)
+        else:
+            raise ValueError("Rows need one bound or equal bounds, got %s <= row <= %s" % (low, high))
+    return senses, rhs
+
+
 class AbstractCallback(ABC):
     @abstractmethod
     def get_val(self, collection, data):
@@ -87,3 +146,9 @@ class AbstractCallback(ABC):
     @abstractmethod
     def add_constr_ge(self, expr, rhs, data):
         pass
+
+    @abstractmethod
+    def set_solution(self, collection, values: dict, data):
+        # values of the variables in collection, by key, offered to the solver as an incumbent while it searches, or
+        # ignored if it cannot take one from this callback
+        pass
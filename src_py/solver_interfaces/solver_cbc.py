@@ -1,12 +1,22 @@
+import multiprocessing as mp
 import os
 import sys
+import warnings
 
 from mip import *
-from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback
+from mip.cbc import cbclib
+from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback, row_senses
+
+
+# cffi looks up a function of the library the first time it is used, holding a lock that is also held while it parses
+# a type. A model freed by the collector during such a parse would wait on that lock forever to look up its
+# destructor, so the destructor is looked up now.
+cbclib.Cbc_deleteModel
 
 
 class SolverCBC(AbstractSolver):
     solver_name = 'CBC'
+    start_ignored = mp.Value("b", False)  # whether a start was ignored, shared with the processes forked to solve
 
     def __init__(self, name):
         model = Model(name, sense=MAXIMIZE, solver_name=CBC)
@@ -21,6 +31,7 @@ class SolverCBC(AbstractSolver):
         self.m = model
         self.callback = None
         self.errored = False
+        self.start = dict()
 
     @staticmethod
     def get_solver_name():
@@ -30,6 +41,10 @@ class SolverCBC(AbstractSolver):
     def check_integrality():
         return False
 
+    @staticmethod
+    def reports_incumbents():
+        return False
+
     def add_vars(self, collection: {dict, list}):
         keys = None
         if isinstance(collection, dict):
@@ -52,6 +67,18 @@ class SolverCBC(AbstractSolver):
     def add_constr_ge(self, expr, rhs: float):
         self.m.add_constr(expr >= rhs)
 
+    def add_constr_matrix(self, variables: list, indptr, indices, data, lower, upper):
+        senses, rhs = row_senses(lower, upper)
+        mip_senses = {"E": EQUAL, "G": GREATER_OR_EQUAL, "L": LESS_OR_EQUAL}
+        indptr, indices, data = indptr.tolist(), indices.tolist(), data.tolist()
+        for r, (sense, b) in enumerate(zip(senses, rhs)):
+            start, end = indptr[r], indptr[r+1]
+            self.m.add_constr(LinExpr([variables[j] for j in indices[start:end]], data[start:end], -b, mip_senses[sense]))
+
+    def set_ub(self, var_list: list, ub: float):
+        for var in var_list:
+            var.ub = ub
+
     def add_sos_constr(self, var_list, weights):
         sos = list(zip(var_list, weights))
         self.m.add_sos(sos, 1)
@@ -60,7 +87,23 @@ class SolverCBC(AbstractSolver):
     def quick_sum(var_list):
         return xsum(var_list)
 
+    def set_start(self, collection: dict, values: dict):
+        # Cbc with a lazy constraint generator can reject a feasible start and report the model infeasible, so with one
+        # the start is ignored
+        if self.m.lazy_constrs_generator is not None:
+            with SolverCBC.start_ignored.get_lock():
+                if not SolverCBC.start_ignored.value:
+                    SolverCBC.start_ignored.value = True
+                    warnings.warn("CBC cannot start from a solution with lazy constraints, starting without one", Warning,
+                                  stacklevel=2)
+            return
+        for key, v in collection.items():
+            self.start[v] = values.get(key, 0.)
+
     def solve(self, timeout: float):
+        if self.start:
+            self.m.start = list(self.start.items())  # rebuilds the whole start, so it is set once per solve
+        self.start = dict()
         status = self.m.optimize(max_seconds=timeout)
         optimal = (status == OptimizationStatus.OPTIMAL) and not self.errored
         return self.m.objective_value, optimal
@@ -68,6 +111,12 @@ class SolverCBC(AbstractSolver):
     def get_objective_value(self):
         return self.m.objective_value
 
+    def has_solution(self):
+        return self.m.num_solutions > 0 and not self.errored
+
+    def get_bound(self):
+        return self.m.objective_bound
+
     @staticmethod
     def get_val(collection) -> dict:
         vars_val = {key: v.x for key, v in collection.items()}
@@ -81,6 +130,11 @@ class SolverCBC(AbstractSolver):
             self.m.cuts_generator = self.callback
         return
 
+    def set_incumbent_callback(self, function):
+        # python-mip does not pass CBC's incumbents on, and a lazy constraint generator to catch them would change the
+        # search, so nothing is reported while solving
+        return
+
     def get_n_vars(self):
         return self.m.num_cols
 
@@ -95,7 +149,6 @@ class CallbackCBC(AbstractCallback, ConstrsGenerator):
     def __init__(self, model: SolverCBC, function):
         self.model = model
         self.function = function
-        self.cut_pool = CutPool()
         return
 
     def generate_constrs(self, data: Model, depth: int = 0, npass: int = 0):
@@ -103,9 +156,6 @@ class CallbackCBC(AbstractCallback, ConstrsGenerator):
         self.function(data)
 
     def add_constr(self, expr: LinExpr, data: Model):
-        # added = self.cut_pool.add(expr)
-        # if not added:
-        #     return
         sense = expr.sense
         n = len(expr.expr)
         variables = [None]*n
@@ -126,6 +176,10 @@ class CallbackCBC(AbstractCallback, ConstrsGenerator):
     def add_constr_ge(self, expr, rhs: float, data):
         self.add_constr(expr >= rhs, data)
 
+    def set_solution(self, collection: dict, values: dict, data: Model):
+        # python-mip has no way to hand CBC a solution while it searches
+        return
+
     def get_val(self, collection: dict, data: Model):
         # TODO: fix when Python-MIP gets fixed
         collection_new = dict()
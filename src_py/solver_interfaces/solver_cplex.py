@@ -1,13 +1,14 @@
 import multiprocessing
 from typing import Union, Tuple
 
-from cplex.callbacks import UserCutCallback, LazyConstraintCallback
-from docplex.mp.callbacks.cb_mixin import ConstraintCallbackMixin
+from cplex.callbacks import HeuristicCallback, IncumbentCallback, UserCutCallback, LazyConstraintCallback
+from docplex.mp.callbacks.cb_mixin import ConstraintCallbackMixin, ModelCallbackMixin
 from docplex.mp.linear import LinearExpr
 from docplex.mp.model import Model
 from docplex.mp.solution import SolveSolution
+from docplex.util.status import JobSolveStatus
 
-from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback
+from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback, row_senses
 
 
 class SolverCPLEX(AbstractSolver):
@@ -19,6 +20,7 @@ class SolverCPLEX(AbstractSolver):
 
         self.m = model
         self.callback = None
+        self.start = dict()
 
     @staticmethod
     def get_solver_name():
@@ -28,6 +30,10 @@ class SolverCPLEX(AbstractSolver):
     def check_integrality():
         return False
 
+    @staticmethod
+    def reports_incumbents():
+        return True
+
     def add_vars(self, collection: {dict, list}):
         keys = None
         if isinstance(collection, dict):
@@ -49,6 +55,18 @@ class SolverCPLEX(AbstractSolver):
     def add_constr_ge(self, expr, rhs: float):
         self.m.add_constraint(expr >= rhs)
 
+    def add_constr_matrix(self, variables: list, indptr, indices, data, lower, upper):
+        senses, rhs = row_senses(lower, upper)
+        cplex_senses = {"E": "eq", "G": "ge", "L": "le"}
+        indptr, indices, data = indptr.tolist(), indices.tolist(), data.tolist()
+        rows = [self.m.linear_constraint(self.m.scal_prod([variables[j] for j in indices[start:end]], data[start:end]),
+                                         b, cplex_senses[sense])
+                for start, end, sense, b in zip(indptr, indptr[1:], senses, rhs)]
+        self.m.add_constraints(rows)  # one batch for docplex, which hands the rows to CPLEX at once
+
+    def set_ub(self, var_list: list, ub: float):
+        self.m.change_var_upper_bounds(var_list, ub)
+
     def add_sos_constr(self, var_list, weights):
         vars_sorted = [var for _, var in sorted(zip(weights, var_list))]
         self.m.add_sos1(vars_sorted)
@@ -56,17 +74,32 @@ class SolverCPLEX(AbstractSolver):
     def quick_sum(self, var_list):
         return self.m.sum(var_list)
 
+    def set_start(self, collection: dict, values: dict):
+        for key, v in collection.items():
+            self.start[v] = values.get(key, 0.)
+
     def solve(self, timeout: float):
         if timeout < 1:
             timeout = 1
         self.m.set_time_limit(int(timeout))
+        if self.start:
+            self.m.add_mip_start(SolveSolution(self.m, self.start))
+            self.start = dict()
         self.m.solve()
-        optimal = self.m.get_solve_status() is not None
+        optimal = self.m.get_solve_status() == JobSolveStatus.OPTIMAL_SOLUTION
+        if not self.has_solution():
+            return -1, False
         return self.m.objective_value, optimal
 
     def get_objective_value(self):
         return self.m.objective_value
 
+    def has_solution(self):
+        return self.m.solution is not None
+
+    def get_bound(self):
+        return self.m.solve_details.best_bound
+
     @staticmethod
     def get_val(collection) -> dict:
         vars_val = {key: v.solution_value for key, v in collection.items()}
@@ -81,8 +114,14 @@ class SolverCPLEX(AbstractSolver):
         if cut:
             cut_cb = self.m.register_callback(CallbackCPLEXCut)
             cut_cb.general_cb = self.callback
+        heuristic_cb = self.m.register_callback(CallbackCPLEXHeuristic)
+        heuristic_cb.general_cb = self.callback
         return
 
+    def set_incumbent_callback(self, function):
+        incumbent_cb = self.m.register_callback(CallbackCPLEXIncumbent)
+        incumbent_cb.function = function
+
     def get_n_vars(self):
         return self.m.number_of_variables
 
@@ -113,6 +152,31 @@ class CallbackCPLEXLazy(ConstraintCallbackMixin, LazyConstraintCallback):
         self.general_cb.execute(self)
 
 
+class CallbackCPLEXHeuristic(ModelCallbackMixin, HeuristicCallback):
+    def __init__(self, env):
+        self.general_cb = None
+        HeuristicCallback.__init__(self, env)
+        ModelCallbackMixin.__init__(self)
+
+    def __call__(self):
+        # the solution offered from the last cut or lazy constraint callback
+        solution = self.general_cb.solution
+        if solution:
+            self.set_solution([[var.index for var in solution], list(solution.values())])
+            self.general_cb.solution = dict()
+
+
+class CallbackCPLEXIncumbent(ModelCallbackMixin, IncumbentCallback):
+    def __init__(self, env):
+        self.function = None
+        IncumbentCallback.__init__(self, env)
+        ModelCallbackMixin.__init__(self)
+
+    def __call__(self):
+        sol = self.make_complete_solution()
+        self.function(sol.get_value_dict, self.get_objective_value(), self.get_best_objective_value())
+
+
 CPLEXCallback = Union[CallbackCPLEXCut, CallbackCPLEXLazy]
 Data = Tuple[CPLEXCallback, SolveSolution]
 
@@ -121,6 +185,7 @@ class CallbackCPLEX(AbstractCallback):
     def __init__(self, model: SolverCPLEX, function):
         self.model = model
         self.function = function
+        self.solution = dict()  # CPLEX only takes solutions in its heuristic callback, where they wait until then
 
     def execute(self, cplex_cb: CPLEXCallback):
         sol = cplex_cb.make_solution()
@@ -152,3 +217,7 @@ class CallbackCPLEX(AbstractCallback):
 
     def add_constr_ge(self, expr, rhs: float, data):
         self.add_constr(expr, "G", rhs, data)
+
+    def set_solution(self, collection, values: dict, data):
+        for key, var in collection.items():
+            self.solution[var] = values.get(key, 0.)
@@ -158,6 +158,10 @@ class SolverGLPK(AbstractSolver):
     def check_integrality():
         return True
 
+    @staticmethod
+    def reports_incumbents():
+        return True
+
     def __init__(self, name: str):
         m = glpk.LPX()
         self.m = m
@@ -165,29 +169,37 @@ class SolverGLPK(AbstractSolver):
         self.vars = []
         self.callback = None
         self.timeout = math.inf
+        self.start = None  # column values handed to the branch-and-bound as a heuristic solution
+        self.solved = False
+        self.incumbent = False
+        self.incumbent_function = None
+        self.gap = 0.  # relative gap of the incumbent, kept up to date by the branch-and-bound callback
 
     def add_vars(self, collection: {dict, list}):
-        new_vars = dict()
         if isinstance(collection, dict):
-            for key in collection.keys():
-                new_vars[key] = self.add_var()
-            return new_vars
+            keys = list(collection.keys())
         elif isinstance(collection, list):
-            for v in collection:
-                new_vars[v] = self.add_var()
-            return new_vars
-        return None
+            keys = collection
+        else:
+            return None
+        first = len(self)
+        if keys:
+            self.m.cols.add(len(keys))  # all the columns at once, GLPK grows its arrays once
+        return {key: self.wrap_var(first+i) for i, key in enumerate(keys)}
 
     def add_var(self, name: str = None):
-        m = self.m
-        m.cols.add(1)
-        var = m.cols[-1]
-        var.kind = bool
+        self.m.cols.add(1)
+        var_ext = self.wrap_var(len(self)-1)
         if name is not None:
-            var.name = name
+            var_ext.var.name = name
+        return var_ext
+
+    def wrap_var(self, index: int):
+        var = self.m.cols[index]
+        var.kind = bool
         var_ext = Variable(var)
-        var_ext.index_model = len(self)-1
-        var_ext.model = m
+        var_ext.index_model = index
+        var_ext.model = self.m
         self.vars += [var_ext]
         return var_ext
 
@@ -234,6 +246,22 @@ class SolverGLPK(AbstractSolver):
         row.bounds = rhs_low, rhs_high
         row.matrix = [(var.index_model, coeff) for var, coeff in expr]
 
+    def add_constr_matrix(self, variables: list, indptr, indices, data, lower, upper):
+        # GLPK takes both bounds of a row, None for none
+        m = self.m
+        first = len(m.rows)
+        count = len(indptr)-1
+        if count == 0:
+            return
+        m.rows.add(count)
+        columns = [var.index_model for var in variables]
+        indptr, indices, data = indptr.tolist(), indices.tolist(), data.tolist()
+        for r, (low, high) in enumerate(zip(lower.tolist(), upper.tolist())):
+            start, end = indptr[r], indptr[r+1]
+            row = m.rows[first+r]
+            row.bounds = None if low == -math.inf else low, None if high == math.inf else high
+            row.matrix = [(columns[j], coeff) for j, coeff in zip(indices[start:end], data[start:end])]
+
     def add_constr_eq(self, expr: {Variable, Expression}, rhs: float):
         self.add_constr(expr, rhs, rhs)
 
@@ -243,6 +271,10 @@ class SolverGLPK(AbstractSolver):
     def add_constr_ge(self, expr: {Variable, Expression}, rhs: float):
         self.add_constr(expr, rhs, None)
 
+    def set_ub(self, var_list: list, ub: float):
+        for var in var_list:
+            var.var.bounds = var.var.bounds[0], ub
+
     def add_sos_constr(self, var_list, weights):  # GLPK has no special treatment for SOS constraints
         self.add_constr_le(var_list, 1)
 
@@ -254,27 +286,52 @@ class SolverGLPK(AbstractSolver):
             reasons += ["cutgen"]
         self.callback = CallbackGLPK(self, function, reasons)
 
+    def set_incumbent_callback(self, function):
+        self.incumbent_function = function
+
+    def set_start(self, collection: dict, values: dict):
+        if self.start is None:
+            self.start = [0.]*len(self)
+        self.start += [0.]*(len(self)-len(self.start))
+        for key, v in collection.items():
+            self.start[v.index_model] = values.get(key, 0.)
+
     def solve(self, timeout=math.inf):
         t0 = time.perf_counter()
         value = -1
+        self.incumbent = False
         msg_lev = glpk.LPX.MSG_OFF
         # msg_lev = glpk.LPX.MSG_ALL
+        # A re-solve starts with dual simplex from the last basis, where only the rows added since are new, instead of
+        # presolving the whole model again.
         self.m.simplex(
             msg_lev=msg_lev, tm_lim=int(timeout*1000),
-            presolve=True
+            presolve=not self.solved,
+            meth=glpk.LPX.DUALP if self.solved else glpk.LPX.PRIMAL,
         )
+        self.solved = True
         if self.m.status != 'opt':
             return value, False
         t1 = time.perf_counter()
         remaining_time = max(timeout-(t1-t0), 1)
+        callback = self.callback
+        if callback is None:
+            callback = CallbackGLPK(self, None, [])
+        if self.start is not None:
+            self.start += [0.]*(len(self)-len(self.start))
+        self.gap = math.inf
         self.m.integer(
-            callback=self.callback, msg_lev=msg_lev, tm_lim=int(remaining_time*1000),
+            callback=callback, msg_lev=msg_lev, tm_lim=int(remaining_time*1000),
             gmi_cuts=True,
             mir_cuts=True,
             # pp_tech=glpk.LPX.PP_ROOT,
         )
+        self.start = None
         optimal = self.m.status == 'opt'
+        self.incumbent = self.m.status in ('opt', 'feas')
         if optimal:
+            self.gap = 0.
+        if self.has_solution():
             value = self.m.obj.value
             for v in self.vars:
                 v.value = v.var.primal
@@ -283,6 +340,13 @@ class SolverGLPK(AbstractSolver):
     def get_objective_value(self):
         return self.m.obj.value
 
+    def has_solution(self):
+        return self.incumbent
+
+    def get_bound(self):
+        value = self.m.obj.value
+        return value + self.gap*abs(value)
+
     def set_timeout(self, timeout):
         self.timeout = timeout
 
@@ -322,7 +386,14 @@ class CallbackGLPK(AbstractCallback):
         return
 
     def default(self, tree: glpk.Tree):
-        if tree.reason in self.reasons:
+        if tree.reason == "bingo" or tree.reason == "select":
+            self.model.gap = tree.gap
+        if tree.reason == "bingo" and self.model.incumbent_function is not None:
+            self.model.incumbent_function(self.model.get_val, self.model.m.obj.value, self.model.get_bound())
+        if tree.reason == "heur" and self.model.start is not None:
+            tree.heuristic(self.model.start)
+            self.model.start = None
+        elif tree.reason in self.reasons:
             self.general(tree)
         return
 
@@ -343,5 +414,9 @@ class CallbackGLPK(AbstractCallback):
     def add_constr_ge(self, expr: {Variable, Expression}, rhs: float, data):
         self.add_constr(expr, rhs, None, data)
 
+    def set_solution(self, collection, values: dict, data):
+        # taken like a start, at the next call for heuristic solutions
+        self.model.set_start(collection, values)
+
     def get_val(self, collection, data) -> dict:
         return self.model.get_val(collection)
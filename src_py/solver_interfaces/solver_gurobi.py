@@ -1,8 +1,10 @@
 import math
 
+import numpy as np
 from gurobipy import *
+from scipy import sparse
 
-from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback
+from solver_interfaces.solver_abstract import AbstractSolver, AbstractCallback, row_senses
 
 setParam('OutputFlag', 0)
 setParam('LazyConstraints', 1)
@@ -14,6 +16,7 @@ class SolverGurobi(AbstractSolver):
     def __init__(self, name):
         self.m = Model(name)
         self.callback = None
+        self.incumbent_function = None
 
     @staticmethod
     def get_solver_name():
@@ -23,6 +26,10 @@ class SolverGurobi(AbstractSolver):
     def check_integrality():
         return False
 
+    @staticmethod
+    def reports_incumbents():
+        return True
+
     def add_vars(self, collection: {dict, list}):
         keys = None
         if isinstance(collection, dict):
@@ -44,6 +51,15 @@ class SolverGurobi(AbstractSolver):
     def add_constr_ge(self, expr, rhs: float):
         self.m.addConstr(expr >= rhs)
 
+    def add_constr_matrix(self, variables: list, indptr, indices, data, lower, upper):
+        senses, rhs = row_senses(lower, upper)
+        gurobi_senses = {"E": GRB.EQUAL, "G": GRB.GREATER_EQUAL, "L": GRB.LESS_EQUAL}
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(indptr)-1, len(variables)))
+        self.m.addMConstr(matrix, variables, np.array([gurobi_senses[sense] for sense in senses]), np.array(rhs))
+
+    def set_ub(self, var_list: list, ub: float):
+        self.m.setAttr(GRB.Attr.UB, var_list, [ub]*len(var_list))
+
     def add_sos_constr(self, var_list, weights):
         self.m.addSOS(GRB.SOS_TYPE1, var_list, weights)
 
@@ -51,9 +67,18 @@ class SolverGurobi(AbstractSolver):
     def quick_sum(var_list):
         return quicksum(var_list)
 
+    def set_start(self, collection: dict, values: dict):
+        for key, v in collection.items():
+            v.Start = values.get(key, 0.)
+
     def solve(self, timeout=math.inf):
         def callback_function(model, where):
             data = [model, where]
+            if where == GRB.Callback.MIPSOL and self.incumbent_function is not None:
+                self.incumbent_function(
+                    lambda collection: dict(zip(collection.keys(), model.cbGetSolution(list(collection.values())))),
+                    model.cbGet(GRB.Callback.MIPSOL_OBJ), model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+                )
             if self.callback is None or where not in self.callback.reasons_dict.keys():
                 return
             violated = self.callback.function(data)
@@ -66,6 +91,12 @@ class SolverGurobi(AbstractSolver):
     def get_objective_value(self):
         return self.m.objVal
 
+    def has_solution(self):
+        return self.m.SolCount > 0
+
+    def get_bound(self):
+        return self.m.ObjBound
+
     @staticmethod
     def get_val(collection: tupledict) -> dict:
         vars_val = {key: v.X for key, v in collection.items()}
@@ -80,6 +111,9 @@ class SolverGurobi(AbstractSolver):
         self.callback = CallbackGurobi(self, function, reasons_dict)
         return
 
+    def set_incumbent_callback(self, function):
+        self.incumbent_function = function
+
     def get_n_vars(self):
         return self.m.NumVars
 
@@ -132,3 +166,9 @@ class CallbackGurobi(AbstractCallback):
 
     def add_constr_ge(self, expr, rhs: float, data):
         self.add_constr(expr >= rhs, data)
+
+    def set_solution(self, collection: tupledict, values: dict, data):
+        model, where = data
+        if where != GRB.Callback.MIPNODE:  # Gurobi only takes solutions at the nodes
+            return
+        model.cbSetSolution(list(collection.values()), [values.get(key, 0.) for key in collection.keys()])
@@ -0,0 +1,108 @@
+"""Plain implementations the array algorithms are checked against, and the random instances they are run on."""
+import functools
+import random
+
+import igraph as ig
+
+
+def random_graph(n, density, rng: random.Random, ndds=0, self_loops=True):
+    # the first ndds vertices are NDDs, which only give and so have no in-edges
+    edges = [(i, j) for i in range(n) for j in range(ndds, n)
+             if (i != j or self_loops and i >= ndds) and rng.random() < density]
+    return ig.Graph(n=n, edges=edges, directed=True)
+
+
+def walk_successors(successors):
+    # chains from their vertex without a predecessor, cycles from their lowest vertex, sorted by that first vertex
+    n = len(successors)
+    has_predecessor = [False]*n
+    for v in successors:
+        if v >= 0:
+            has_predecessor[v] = True
+    structures = []
+    for v in range(n):
+        if successors[v] >= 0 and not has_predecessor[v]:
+            chain = [v]
+            while successors[chain[-1]] >= 0:
+                chain.append(successors[chain[-1]])
+            structures.append((chain, False))
+    for v in range(n):
+        if not has_predecessor[v]:
+            continue
+        cycle = [v]
+        while successors[cycle[-1]] >= 0 and successors[cycle[-1]] != v and len(cycle) <= n:
+            cycle.append(successors[cycle[-1]])
+        if successors[cycle[-1]] == v and v == min(cycle):
+            structures.append((cycle, True))
+    return sorted(structures, key=lambda structure: structure[0][0])
+
+
+def simple_cycles(graph: ig.Graph, k):
+    # every cycle of at most k vertices once, from its lowest vertex, by depth-first search over higher vertices
+    out_neighs = [graph.neighbors(v, mode=ig.OUT) for v in range(graph.vcount())]
+    cycles = []
+
+    def extend(path):
+        for v in sorted(set(out_neighs[path[-1]])):
+            if v == path[0]:
+                cycles.append(list(path))
+            elif v > path[0] and v not in path and len(path) < k:
+                extend(path + [v])
+
+    if k >= 1:
+        for root in range(graph.vcount()):
+            extend([root])
+    return sorted(cycles)
+
+
+def chains(graph: ig.Graph, ndds, max_length):
+    # every chain of 1 to max_length edges from an NDD through distinct patients
+    is_ndd = set(ndds)
+    out_neighs = [graph.neighbors(v, mode=ig.OUT) for v in range(graph.vcount())]
+    found = []
+
+    def extend(path):
+        found.append(list(path))
+        if len(path) - 1 == max_length:
+            return
+        for v in sorted(set(out_neighs[path[-1]])):
+            if v not in is_ndd and v not in path:
+                extend(path + [v])
+
+    for ndd in ndds:
+        for v in sorted(set(out_neighs[ndd])):
+            if v not in is_ndd and max_length >= 1:
+                extend([ndd, v])
+    return found
+
+
+def best_matching_value(graph: ig.Graph, weights, ndds, cycle_length, chain_length):
+    # the optimum over all vertex-disjoint packings of cycles and chains, by trying every structure through the lowest
+    # vertex not decided yet
+    structures = []
+    for cycle in simple_cycles(graph, cycle_length):
+        if any(v in ndds for v in cycle):
+            continue
+        value = sum(weights[u, v] for u, v in zip(cycle, cycle[1:] + cycle[:1]))
+        structures.append((cycle, value))
+    for chain in chains(graph, ndds, chain_length):
+        structures.append((chain, sum(weights[u, v] for u, v in zip(chain, chain[1:]))))
+    through = [[] for _ in range(graph.vcount())]
+    for vertices, value in structures:
+        mask = sum(1 << v for v in vertices)
+        for v in vertices:
+            through[v].append((mask, value))
+
+    @functools.lru_cache(maxsize=None)
+    def best(decided):
+        free = [v for v in range(graph.vcount()) if not decided >> v & 1]
+        if not free:
+            return 0
+        v = free[0]
+        value = best(decided | 1 << v)
+        for mask, structure_value in through[v]:
+            if not mask & decided:
+                value = max(value, structure_value + best(decided | mask))
+        return value
+
+    return best(0)
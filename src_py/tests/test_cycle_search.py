@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from reference import random_graph, simple_cycles
+from utils.cycle_store import CycleWriter
+from utils.graph_utils import cycles_as_lists, simple_cycles_flat, simple_cycles_limited_length, \
+    simple_cycles_parallel
+
+
+def random_case(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 14)
+    return random_graph(n, rng.choice([0.1, 0.25, 0.5]), rng), rng.randint(1, 6)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_cycle_search_matches_reference(seed):
+    graph, k = random_case(seed)
+    assert sorted(simple_cycles_limited_length(graph, k)) == simple_cycles(graph, k)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_parallel_cycle_search_matches_reference(seed):
+    graph, k = random_case(seed)
+    vertices, offsets = simple_cycles_parallel(graph, k, processes=2)
+    assert sorted(cycles_as_lists(vertices, offsets)) == simple_cycles(graph, k)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_cycle_search_on_disk_matches_reference(seed):
+    graph, k = random_case(seed)
+    writer = CycleWriter(None, 8)  # small chunks, so the cycles are written in several parts
+    vertices, offsets = simple_cycles_flat(graph, k, writer=writer)
+    cycles = sorted(cycles_as_lists(vertices, offsets))
+    del vertices, offsets
+    writer.discard()
+    assert cycles == simple_cycles(graph, k)
@@ -0,0 +1,29 @@
+import random
+
+import numpy as np
+import pytest
+
+from reference import walk_successors
+from utils.graph_utils import decode_successors
+
+
+def random_successors(n, rng: random.Random, broken_share):
+    # a random permutation with some of its edges removed, which leaves disjoint cycles and chains
+    permutation = list(range(n))
+    rng.shuffle(permutation)
+    return [-1 if rng.random() < broken_share else w for w in permutation]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_decode_successors_matches_walk(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 60)
+    successors = random_successors(n, rng, rng.choice([0, 0.05, 0.3, 1]))
+    vertices, offsets, is_cycle = decode_successors(np.array(successors, dtype=np.int64))
+    decoded = [(vertices[offsets[i]:offsets[i+1]].tolist(), bool(is_cycle[i])) for i in range(len(is_cycle))]
+    assert decoded == walk_successors(successors)
+
+
+def test_decode_successors_empty():
+    vertices, offsets, is_cycle = decode_successors(np.full(5, -1, dtype=np.int64))
+    assert len(vertices) == 0 and offsets.tolist() == [0] and len(is_cycle) == 0
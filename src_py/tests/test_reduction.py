@@ -0,0 +1,34 @@
+import random
+import time
+
+import pytest
+
+from reference import best_matching_value, random_graph
+from utils.edge_weights import EdgeWeights
+from utils.reduction import reduce_input
+from utils.transport import Input
+
+
+def random_input(seed):
+    rng = random.Random(seed)
+    n = rng.randint(2, 10)
+    n_ndds = rng.randint(0, min(2, n-1))
+    graph = random_graph(n, rng.choice([0.15, 0.3]), rng, ndds=n_ndds)
+    edges = graph.get_edgelist()
+    weights = EdgeWeights(n, [i for i, _ in edges], [j for _, j in edges], [rng.randint(1, 5) for _ in edges])
+    input_data = Input(graph, weights, list(range(n_ndds)), rng.randint(1, 4), rng.choice([1, 2, 3, n]), [])
+    input_data.start_time = time.perf_counter()
+    return input_data
+
+
+def optimum(input_data: Input):
+    return best_matching_value(input_data.graph, input_data.weights, input_data.ndds, input_data.cycle_length,
+                               input_data.chain_length)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_reduction_keeps_the_optimum(seed):
+    input_data = random_input(seed)
+    reduced = reduce_input(input_data)
+    reduced_input = input_data if reduced is None else reduced[1]
+    assert optimum(reduced_input) == optimum(input_data)
@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+
+from utils.graph_utils import chain_edges
+
+
+class ConstraintMatrix:
+    """Linear constraints gathered block by block as coordinates over the columns of a list of variables, and added to
+    a model at once as one CSR matrix with a lower and an upper bound for every row (-inf and inf for none). Adding
+    them empties the matrix, so very large blocks can be added in parts."""
+
+    def __init__(self):
+        self.variables = []
+        self.rows = []
+        self.columns = []
+        self.coeffs = []
+        self.lower = []
+        self.upper = []
+        self.n_rows = 0
+
+    def add_columns(self, collection: dict) -> int:
+        # the variables of a collection in order, returns the column of the first one
+        first = len(self.variables)
+        self.variables += list(collection.values())
+        return first
+
+    def add_rows(self, count, rows, columns, coeffs, lower, upper):
+        # count new rows, with coefficients at (rows, columns) where rows count from 0 in the block, and bounds given
+        # as arrays or as one number for all of them
+        rows = np.asarray(rows, dtype=np.int64)
+        self.rows.append(rows + self.n_rows)
+        self.columns.append(np.asarray(columns, dtype=np.int64))
+        self.coeffs.append(np.broadcast_to(np.asarray(coeffs, dtype=float), rows.shape))
+        self.lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (count,)))
+        self.upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (count,)))
+        self.n_rows += count
+
+    def csr(self):
+        # repeated coefficients of a row and column are summed, as in an expression holding a variable twice
+        n_columns = max(len(self.variables), 1)
+        keys = np.concatenate(self.rows) * n_columns + np.concatenate(self.columns)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        data = np.bincount(inverse.reshape(-1), weights=np.concatenate(self.coeffs), minlength=len(keys))
+        indptr = np.zeros(self.n_rows+1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_columns, minlength=self.n_rows), out=indptr[1:])
+        return indptr, (keys % n_columns).astype(np.int32), data, np.concatenate(self.lower), np.concatenate(self.upper)
+
+    def add_to(self, m):
+        if self.n_rows > 0:
+            m.add_constr_matrix(self.variables, *self.csr())
+        self.rows, self.columns, self.coeffs, self.lower, self.upper = [], [], [], [], []
+        self.n_rows = 0
+
+
+def key_columns(keys):
+    # The position of every key among the distinct keys in order of first appearance, which is the order add_vars
+    # creates their variables in, and the distinct keys in that order.
+    distinct, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    position = np.empty(len(first), dtype=np.int64)
+    position[order] = np.arange(len(first))
+    return position[inverse.reshape(-1)], distinct[order]
+
+
+def add_flow_rows(matrix: ConstraintMatrix, heads, tails, edge_columns, in_columns, out_columns):
+    # The in and out flows of every vertex are the sums of its edges, in rows 2v and 2v+1 for the vertex at position v
+    # of the flow columns, which keeps the order the rows were added in one vertex at a time.
+    count = len(in_columns)
+    vertices = np.arange(count)
+    matrix.add_rows(2*count, np.concatenate((2*heads, 2*tails+1, 2*vertices, 2*vertices+1)),
+                    np.concatenate((edge_columns, edge_columns, in_columns, out_columns)),
+                    np.concatenate((np.ones(2*len(edge_columns)), -np.ones(2*count))), 0, 0)
+
+
+class ChainCopies:
+    """Per-NDD copies of the chain variables, each over the edges and vertices its NDD can reach within the chain
+    length, with the rows tying every copy into a single chain of at most that length: the edges of a copy are at
+    most the chain length, its in and out flows are the sums of its edges, and a patient only gives if it receives,
+    or exactly then if it is forbidden to end a chain.
+
+    For every copy variable, the arrays hold its column and the edge key (origin*n + destination) or vertex it
+    copies."""
+
+    def __init__(self, m, matrix: ConstraintMatrix, n, out_neighbors, ndds, max_chain_length, forbidden_nodes,
+                 break_symmetry=False):
+        # break_symmetry fixes the in flow of every NDD in its own copy to 0
+        is_ndd = set(ndds)
+        forbidden = np.zeros(n, dtype=bool)
+        forbidden[list(forbidden_nodes)] = True
+        self.x_ndds = [None]*len(ndds)
+        self.in_ndds = [None]*len(ndds)
+        self.out_ndds = [None]*len(ndds)
+        edge_columns, edge_keys, vertices, in_columns, out_columns = [], [], [], [], []
+        for n_id in ndds:
+            edges, reached = chain_edges(out_neighbors, n_id, max_chain_length, is_ndd)
+            self.x_ndds[n_id] = m.add_vars(edges)
+            self.in_ndds[n_id] = m.add_vars(reached)
+            self.out_ndds[n_id] = m.add_vars(reached)
+            x0 = matrix.add_columns(self.x_ndds[n_id])
+            in0 = matrix.add_columns(self.in_ndds[n_id])
+            out0 = matrix.add_columns(self.out_ndds[n_id])
+
+            edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+            reached = np.array(reached, dtype=np.int64)
+            columns, distinct = key_columns(edges[:, 0]*n + edges[:, 1])
+            columns += x0
+            if break_symmetry:
+                matrix.add_rows(1, [0], [in0 + int(np.searchsorted(reached, n_id))], 1, 0, 0)
+            matrix.add_rows(1, np.zeros(len(columns)), columns, 1, -math.inf, max_chain_length)
+            # reached is sorted, so the copies of the flows of a vertex are found by bisection
+            heads = np.searchsorted(reached, edges[:, 1])
+            tails = np.searchsorted(reached, edges[:, 0])
+            in_vertex_columns = in0 + np.arange(len(reached))
+            out_vertex_columns = out0 + np.arange(len(reached))
+            add_flow_rows(matrix, heads, tails, columns, in_vertex_columns, out_vertex_columns)
+            patients = np.flatnonzero(~np.isin(reached, ndds))
+            rows = np.arange(len(patients))
+            matrix.add_rows(len(patients), np.concatenate((rows, rows)),
+                            np.concatenate((out_vertex_columns[patients], in_vertex_columns[patients])),
+                            np.repeat([1., -1.], len(patients)),
+                            np.where(forbidden[reached[patients]], 0, -math.inf), 0)
+
+            edge_columns.append(x0 + np.arange(len(distinct)))
+            edge_keys.append(distinct)
+            vertices.append(reached)
+            in_columns.append(in_vertex_columns)
+            out_columns.append(out_vertex_columns)
+
+        empty = np.zeros(0, dtype=np.int64)
+        self.edge_columns = np.concatenate(edge_columns) if ndds else empty
+        self.edge_keys = np.concatenate(edge_keys) if ndds else empty
+        self.vertices = np.concatenate(vertices) if ndds else empty
+        self.in_columns = np.concatenate(in_columns) if ndds else empty
+        self.out_columns = np.concatenate(out_columns) if ndds else empty
+
+    def add_edge_sums(self, matrix: ConstraintMatrix, keys, first):
+        # rows making the variables of the distinct edge keys, in columns from first on, the sums of their copies
+        count = len(keys)
+        order = np.argsort(keys)
+        rows = order[np.searchsorted(keys, self.edge_keys, sorter=order)]
+        matrix.add_rows(count, np.concatenate((rows, np.arange(count))),
+                        np.concatenate((self.edge_columns, first+np.arange(count))),
+                        np.concatenate((np.ones(len(rows)), -np.ones(count))), 0, 0)
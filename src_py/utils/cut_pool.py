@@ -0,0 +1,52 @@
+from constants import cut_pool_max_age
+
+
+class CutPool:
+    """The cuts added to one model, by kind, sorted support and right-hand side, with how often each was found
+    violated and the last separation round it was found in.
+
+    A cut added as a row of the model, outside of a callback, can never be violated again, so finding it again is a
+    duplicate and it is not added. A cut added from a callback may be dropped by the solver, so finding it violated in
+    a later round adds it again, and only repeats within the round it was added in are duplicates. Cuts that are not
+    found violated for cut_pool_max_age rounds are forgotten."""
+
+    def __init__(self):
+        self.cuts = dict()  # key -> [times violated, last round violated, kept as a row of the model]
+        self.round = 0
+        self.added = 0
+        self.duplicates = 0
+        self.added_again = 0
+        self.aged_out = 0
+
+    def next_round(self):
+        self.round += 1
+        if cut_pool_max_age is not None and self.round % cut_pool_max_age == 0:
+            oldest = self.round - cut_pool_max_age
+            inactive = [key for key, (_, last, row) in self.cuts.items() if last < oldest and not row]
+            for key in inactive:
+                del self.cuts[key]
+            self.aged_out += len(inactive)
+
+    def add(self, kind, support, rhs, callback=False) -> bool:
+        # True when the cut has to be added to the model
+        key = (kind, tuple(sorted(support)), rhs)
+        stats = self.cuts.get(key)
+        if stats is None:
+            self.cuts[key] = [1, self.round, not callback]
+            self.added += 1
+            return True
+        stats[0] += 1
+        if stats[2] or stats[1] == self.round:
+            self.duplicates += 1
+            return False
+        stats[1] = self.round
+        stats[2] = not callback
+        self.added_again += 1
+        return True
+
+    def print_summary(self):
+        if self.added == 0:
+            return
+        most = max((stats[0] for stats in self.cuts.values()), default=0)
+        print("Cut pool: %s cuts added, %s duplicates avoided, %s added again after the solver dropped them, "
+              "%s aged out, violated at most %s times" % (self.added, self.duplicates, self.added_again, self.aged_out, most))
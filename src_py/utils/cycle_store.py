@@ -0,0 +1,149 @@
+import tempfile
+
+import numpy as np
+
+from utils.edge_weights import EdgeWeights
+
+
+class CycleStore:
+    """Cycles as one flat int32 vertex array with offsets, their weights, and a vertex -> cycle incidence CSR.
+
+    On disk, the weights and the incidence live in memory-mapped temporary files and are built batch by batch, so the
+    vertex and offset arrays may be memory-mapped as well (see CycleWriter), with files the open temporary files
+    behind them. The store owns all of these files and closes them when it is discarded or collected. This keeps the
+    vertex lists and the incidence, which grow with the total length of the cycles, out of RAM; the formulations
+    still create a solver variable for every cycle.
+    """
+
+    def __init__(self, n: int, vertices, offsets, edge_weights: EdgeWeights, on_disk=False, directory=None,
+                 batch_size=1 << 20, files=()):
+        self.files = list(files)
+        self.n = n
+        self.vertices = vertices
+        self.offsets = offsets
+        self.on_disk = on_disk
+        self.directory = directory
+        self.batch_size = batch_size
+
+        self.weights = self.allocate(float, len(self))
+        counts = np.zeros(n, dtype=np.int64)
+        for start, end, batch_vertices, batch_offsets in self.batches():
+            self.weights[start:end] = cycle_weights(batch_vertices, batch_offsets, edge_weights)
+            counts += np.bincount(batch_vertices, minlength=n)
+
+        self.incidence_indptr = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(counts, out=self.incidence_indptr[1:])
+        self.incidence_indices = self.allocate(np.int32, len(vertices))
+        cursor = self.incidence_indptr[:-1].copy()
+        for start, end, batch_vertices, batch_offsets in self.batches():
+            cycle_ids = np.repeat(np.arange(start, end, dtype=np.int32), np.diff(batch_offsets))
+            order = np.argsort(batch_vertices, kind="stable")
+            sorted_vertices = batch_vertices[order]
+            batch_counts = np.bincount(sorted_vertices, minlength=n)
+            rank = np.arange(len(order)) - (np.cumsum(batch_counts)-batch_counts)[sorted_vertices]
+            self.incidence_indices[cursor[sorted_vertices]+rank] = cycle_ids[order]
+            cursor += batch_counts
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, i):
+        return np.asarray(self.vertices[self.offsets[i]:self.offsets[i+1]])
+
+    def allocate(self, dtype, length):
+        if not self.on_disk:
+            return np.zeros(length, dtype=dtype)
+        file = tempfile.TemporaryFile(dir=self.directory)
+        self.files.append(file)
+        return map_array(file, dtype, length, "w+")
+
+    def discard(self):
+        # A memory map keeps its own handle on the file, so the arrays stay readable until they are released.
+        for file in self.files:
+            file.close()
+        self.files = []
+
+    def __del__(self):
+        self.discard()
+
+    def batches(self):
+        for start in range(0, len(self), self.batch_size):
+            end = min(start+self.batch_size, len(self))
+            first = int(self.offsets[start])
+            batch_vertices = np.asarray(self.vertices[first:self.offsets[end]])
+            batch_offsets = np.asarray(self.offsets[start:end+1]) - first
+            yield start, end, batch_vertices, batch_offsets
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def cycle(self, i):
+        return self[i].tolist()
+
+    def cycles_of(self, v):
+        return np.asarray(self.incidence_indices[self.incidence_indptr[v]:self.incidence_indptr[v+1]])
+
+    def subset(self, cycle_ids, edge_weights: EdgeWeights):
+        cycles = [self[i] for i in cycle_ids]
+        lengths = [len(cycle) for cycle in cycles]
+        offsets = np.zeros(len(cycles)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        vertices = np.concatenate(cycles) if cycles else np.zeros(0, dtype=np.int32)
+        return CycleStore(self.n, vertices, offsets, edge_weights)
+
+
+class CycleWriter:
+    """Receives enumerated cycles chunk by chunk and appends them to temporary files, which are memory-mapped at the
+    end. Temporary files have no name on POSIX systems, so nothing is left behind if the process is killed. The files
+    are handed to the CycleStore built from the arrays, or closed with discard when the search is abandoned."""
+
+    def __init__(self, directory, chunk_size):
+        self.chunk_size = chunk_size
+        self.vertices_file = tempfile.TemporaryFile(dir=directory)
+        self.lengths_file = tempfile.TemporaryFile(dir=directory)
+        self.offsets_file = tempfile.TemporaryFile(dir=directory)
+        self.files = [self.vertices_file, self.lengths_file, self.offsets_file]
+        self.num_vertices = 0
+        self.num_cycles = 0
+
+    def write(self, vertices, lengths):
+        np.asarray(vertices, dtype=np.int32).tofile(self.vertices_file)
+        np.asarray(lengths, dtype=np.int32).tofile(self.lengths_file)
+        self.num_vertices += len(vertices)
+        self.num_cycles += len(lengths)
+
+    def close(self):
+        self.vertices_file.flush()
+        self.lengths_file.flush()
+        vertices = map_array(self.vertices_file, np.int32, self.num_vertices, "r")
+        lengths = map_array(self.lengths_file, np.int32, self.num_cycles, "r")
+        offsets = map_array(self.offsets_file, np.int64, self.num_cycles+1, "w+")
+        offsets[0] = 0
+        np.cumsum(lengths, out=offsets[1:])
+        return vertices, offsets
+
+    def discard(self):
+        for file in self.files:
+            file.close()
+
+
+def map_array(file, dtype, length, mode):
+    if length == 0:  # empty files cannot be memory-mapped
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode=mode, shape=(length,))
+
+
+def cycle_successors(vertices, offsets):
+    # vertex following each position of the flat array, wrapping around at the end of every cycle
+    successors = np.arange(1, len(vertices)+1, dtype=np.int64)
+    if len(offsets) > 1:
+        successors[offsets[1:]-1] = offsets[:-1]
+    return vertices[successors]
+
+
+def cycle_weights(vertices, offsets, edge_weights: EdgeWeights):
+    if len(offsets) <= 1:
+        return np.zeros(0, dtype=float)
+    weights = edge_weights.lookup(vertices, cycle_successors(vertices, offsets))
+    return np.add.reduceat(weights, offsets[:-1])
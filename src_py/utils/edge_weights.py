@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class EdgeWeights:
+    """Sparse edge weights: one value per igraph edge id plus a CSR index by (origin, destination)."""
+
+    def __init__(self, n: int, origins, destinations, values):
+        self.n = n
+        self.origins = np.asarray(origins, dtype=np.int32)
+        self.destinations = np.asarray(destinations, dtype=np.int32)
+        self.values = np.asarray(values, dtype=float)
+
+        keys = self.origins.astype(np.int64) * n + self.destinations
+        order = np.argsort(keys, kind="stable")  # stable, so the last repeated edge wins as in a dense matrix
+        self.keys = keys[order]
+        self.indices = self.destinations[order]
+        self.data = self.values[order]
+        self.indptr = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(np.bincount(self.origins, minlength=n), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, pair):
+        i, j = pair
+        key = int(i) * self.n + int(j)
+        pos = np.searchsorted(self.keys, key, side="right") - 1
+        if pos < 0 or self.keys[pos] != key:
+            return 0.
+        return float(self.data[pos])
+
+    def lookup(self, origins, destinations):
+        keys = np.asarray(origins, dtype=np.int64) * self.n + np.asarray(destinations, dtype=np.int64)
+        pos = np.searchsorted(self.keys, keys, side="right") - 1
+        found = pos >= 0
+        found[found] = self.keys[pos[found]] == keys[found]
+        result = np.zeros(keys.shape, dtype=float)
+        result[found] = self.data[pos[found]]
+        return result
+
+    def row(self, i):
+        start, end = self.indptr[i], self.indptr[i+1]
+        return self.indices[start:end], self.data[start:end]
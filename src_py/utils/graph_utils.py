@@ -1,129 +1,436 @@
+import heapq
 import math
+import multiprocessing as mp
 import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
 import igraph as ig
+import numpy as np
+
+
+
+def adjacency_csr(graph: ig.Graph):
+    n = graph.vcount()
+    base = max(n, 1)
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    keys = np.unique(edges[:, 0] * base + edges[:, 1])  # sorted, without repeated edges
+    indices = (keys % base).astype(np.int32)
+    indptr = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // base, minlength=n), out=indptr[1:])
+    return indptr, indices
+
+
+class CycleSearchStats:
+    def __init__(self, n):
+        self.expanded = np.zeros(n, dtype=np.int64)  # paths extended by one vertex, per root
+        self.pruned = np.zeros(n, dtype=np.int64)  # extensions cut because the root is too far away, per root
+        self.cycles = np.zeros(n, dtype=np.int64)
+
+    def summary(self):
+        expanded = int(self.expanded.sum())
+        pruned = int(self.pruned.sum())
+        share = 100*pruned/max(expanded+pruned, 1)
+        return "%s branches expanded, %s pruned by distance to root (%.1f%%)" % (expanded, pruned, share)
+
+
+class StrongComponents:
+    """Strongly connected components with at least two vertices or a self-loop, the only places where cycles can be
+    found.
+
+    Each component keeps its members in increasing order and adjacency lists over the edges inside it, with vertices
+    renumbered 0..size-1 in the same order, so a search inside a component finds the same cycles, in the same order,
+    as a search over the whole graph.
+    """
+
+    def __init__(self, graph: ig.Graph):
+        n = graph.vcount()
+        indptr, indices = adjacency_csr(graph)
+        sources = np.repeat(np.arange(n), np.diff(indptr))
+        membership = np.array(graph.connected_components(mode="strong").membership, dtype=np.int64).reshape(-1)
+        sizes = np.bincount(membership, minlength=1)
+        looped = np.zeros(len(sizes), dtype=bool)
+        looped[membership[sources[sources == indices]]] = True  # a single vertex with a self-loop is a cycle
+        labels, first = np.unique(membership, return_index=True)
+        labels = labels[np.argsort(first)]  # components ordered by their smallest vertex
+        labels = labels[(sizes[labels] > 1) | looped[labels]]
+
+        self.component_of = np.full(n, -1, dtype=np.int64)
+        self.local_ids = np.zeros(n, dtype=np.int64)
+        self.members = []
+        for c, label in enumerate(labels.tolist()):
+            members = np.flatnonzero(membership == label).astype(np.int32)
+            self.component_of[members] = c
+            self.local_ids[members] = np.arange(len(members))
+            self.members.append(members)
+
+        component = self.component_of[sources]
+        inside = (component >= 0) & (component == self.component_of[indices])
+        sources, targets, component = sources[inside], indices[inside], component[inside]
+        order = np.argsort(component, kind="stable")  # keeps the edges of every component sorted
+        bounds = np.searchsorted(component[order], np.arange(len(self.members)+1))
+        local_sources = self.local_ids[sources[order]]
+        local_targets = self.local_ids[targets[order]]
+        self.edges = [(local_sources[bounds[c]:bounds[c+1]], local_targets[bounds[c]:bounds[c+1]])
+                      for c in range(len(self.members))]
+
+    def __len__(self):
+        return len(self.members)
+
+    def searcher(self, c, k, deadline):
+        size = len(self.members[c])
+        sources, targets = self.edges[c]
+        indptr = np.zeros(size+1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+        out_neighs, in_neighs = neighbor_lists(size, indptr, targets)
+        return RootSearch(size, k, out_neighs, in_neighs, deadline)
+
+    def to_global(self, c, local_vertices: array):
+        vertices = array("i")
+        vertices.frombytes(self.members[c][np.frombuffer(local_vertices, dtype=np.int32)].tobytes())
+        return vertices
+
+    def search_estimates(self):
+        # Roots with many edges to and from larger vertices have the largest search trees.
+        estimate = np.zeros(len(self.component_of), dtype=np.int64)
+        for members, (sources, targets) in zip(self.members, self.edges):
+            forward = targets > sources
+            out_larger = np.bincount(sources[forward], minlength=len(members))
+            in_larger = np.bincount(targets[~forward], minlength=len(members))
+            estimate[members] = (out_larger+1)*(in_larger+1)
+        return estimate
+
+
+def simple_cycles_flat(graph: ig.Graph, k, remaining_time=math.inf, stats: CycleSearchStats = None, writer=None):
+    # Every nontrivial strongly connected component is searched on its own and its cycles are mapped back to the
+    # global vertex ids, so the cycles come out grouped by component.
+    # With a writer (see utils.cycle_store.CycleWriter), cycles are handed over in chunks of about writer.chunk_size
+    # vertices instead of being kept in memory, and the arrays returned are the ones from writer.close().
+    deadline = time.perf_counter()+remaining_time
+    vertices = array("i")
+    lengths = array("i")
+    if k >= 1:
+        components = StrongComponents(graph)
+        for c, members in enumerate(components.members):
+            searcher = components.searcher(c, k, deadline)
+            local_vertices = array("i")
+            for root in range(len(members)):
+                if time.perf_counter() > deadline:
+                    return None
+                result = searcher.search(root, local_vertices, lengths)
+                if result is None:
+                    return None
+                if stats is not None:
+                    stats.expanded[members[root]], stats.pruned[members[root]], stats.cycles[members[root]] = result
+                if writer is not None and len(vertices)+len(local_vertices) >= writer.chunk_size:
+                    vertices += components.to_global(c, local_vertices)
+                    writer.write(vertices, lengths)
+                    local_vertices = array("i")
+                    vertices = array("i")
+                    lengths = array("i")
+            vertices += components.to_global(c, local_vertices)
+    if writer is not None:
+        writer.write(vertices, lengths)
+        return writer.close()
+    return to_flat(vertices, lengths)
+
+
+def neighbor_lists(n, indptr, indices):
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    out_neighs = [indices[indptr[v]:indptr[v+1]] for v in range(n)]
+    in_neighs = [[] for _ in range(n)]
+    for u in range(n):
+        for v in out_neighs[u]:
+            in_neighs[v].append(u)
+    return out_neighs, in_neighs
+
+
+def to_flat(vertices: array, lengths: array):
+    offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(np.frombuffer(lengths, dtype=np.int32), out=offsets[1:])
+    return np.frombuffer(vertices, dtype=np.int32), offsets
+
+
+def cycles_as_lists(vertices, offsets):
+    return [vertices[offsets[i]:offsets[i+1]].tolist() for i in range(len(offsets)-1)]
+
+
+class RootSearch:
+    def __init__(self, n, k, out_neighs, in_neighs, deadline):
+        self.k = k
+        self.out_neighs = out_neighs
+        self.in_neighs = in_neighs
+        self.deadline = deadline
+        self.on_path = bytearray(n)
+        self.dist = [k]*n
 
-from utils.parallel_procs import from_list
-# from parallel_procs import from_list
+    def search(self, root, vertices: array, lengths: array):
+        k, dist = self.k, self.dist
+        reached = distances_to_root(root, k-1, self.in_neighs, dist)
+        num_cycles = len(lengths)
+        finished, expanded, pruned = cycles_from_root(
+            root, k, self.out_neighs, self.on_path, dist, vertices, lengths, self.deadline
+        )
+        for u in reached:
+            dist[u] = k
+        if not finished:
+            return None
+        return expanded, pruned, len(lengths)-num_cycles
+
+
+def distances_to_root(root, max_dist, in_neighs, dist):
+    # Breadth-first search backwards from the root over vertices larger than the root, up to max_dist hops.
+    # Vertices that are not reached keep their previous distance, which the caller sets larger than max_dist.
+    dist[root] = 0
+    reached = [root]
+    frontier = [root]
+    for d in range(1, max_dist+1):
+        next_frontier = []
+        for u in frontier:
+            neighbors = in_neighs[u]
+            for w in islice(neighbors, bisect_right(neighbors, root), None):
+                if dist[w] > d:
+                    dist[w] = d
+                    next_frontier.append(w)
+        if not next_frontier:
+            break
+        reached += next_frontier
+        frontier = next_frontier
+    return reached
+
+
+def cycles_from_root(root, k, out_neighs, on_path, dist, vertices, lengths, deadline=math.inf, check_every=1024):
+    # Depth-first search with an explicit stack of neighbor iterators. Only vertices larger than the root are visited,
+    # so each cycle is found once, starting at its smallest vertex, and with sorted neighbors the cycles come out in
+    # lexicographic order. A vertex is only added when dist says it can still get back to the root within k edges,
+    # and the last vertex of a cycle of length k is emitted without being pushed.
+    path = [root]
+    neighbors = out_neighs[root]
+    stack = [islice(neighbors, bisect_left(neighbors, root), None)]
+    on_path[root] = 1
+    expanded = 0
+    pruned = 0
+    while stack:
+        for v in stack[-1]:
+            if v == root:
+                vertices.extend(path)
+                lengths.append(len(path))
+            elif not on_path[v]:
+                if dist[v] > k-len(path):
+                    pruned += 1
+                elif len(path) < k-1:
+                    path.append(v)
+                    on_path[v] = 1
+                    neighbors = out_neighs[v]
+                    stack.append(islice(neighbors, bisect_left(neighbors, root), None))
+                    break
+                else:
+                    vertices.extend(path)
+                    vertices.append(v)
+                    lengths.append(len(path)+1)
+        else:
+            on_path[path.pop()] = 0
+            stack.pop()
+            continue
+        expanded += 1
+        if expanded % check_every == 0 and time.perf_counter() > deadline:
+            for u in path:
+                on_path[u] = 0
+            return False, expanded, pruned
+    return True, expanded, pruned
+
+
+def simple_cycles_limited_length(graph: ig.Graph, k, remaining_time=math.inf, stats: CycleSearchStats = None):
+    result = simple_cycles_flat(graph, k, remaining_time, stats)
+    if result is None:
+        return None
+    return cycles_as_lists(*result)
 
 
-def find_cycles(g: ig.Graph, k, time_limit=math.inf):  # own implementation
-    t0 = time.perf_counter()
-    path_dict = dict()
-    cycles = []
-    in_neighs = [g.neighbors(v, mode=ig.IN) for v in g.vs]
-    out_neighs = [g.neighbors(v, mode=ig.OUT) for v in g.vs]
-    for length in range(k):
-        for u in g.vs:
-            tf = time.perf_counter()
-            if tf-t0 > time_limit:
+shared_search = None  # set before the worker processes are forked, so they inherit the adjacency lists
+
+
+def simple_cycles_parallel(graph: ig.Graph, k, remaining_time=math.inf, stats: CycleSearchStats = None,
+                           processes=None, writer=None, chunks_per_process=8):
+    # Roots of all nontrivial strongly connected components are scheduled together, so large components are split
+    # over several workers and small ones share a worker.
+    # With a writer, chunks are written as they arrive, so the cycles are not in canonical order.
+    global shared_search
+    if k < 1 or "fork" not in mp.get_all_start_methods():
+        return simple_cycles_flat(graph, k, remaining_time, stats, writer)
+    deadline = time.perf_counter()+remaining_time
+    components = StrongComponents(graph)
+    processes = processes or mp.cpu_count()
+    chunks = root_chunks(components, processes*chunks_per_process)
+
+    searchers = [components.searcher(c, k, deadline) for c in range(len(components))]
+    shared_search = components, searchers
+    pool = mp.get_context("fork").Pool(processes=processes)
+    segments = []
+    try:
+        for chunk_segments in pool.imap_unordered(search_chunk, chunks):
+            if chunk_segments is None or time.perf_counter() > deadline:
+                pool.terminate()
                 return None
-            u_index = u.index
-            paths = find_simple_paths_node(g, u_index, length, path_dict, out_neighs)
-            in_neighbors = in_neighs[u_index]
-            cycles_u = [list(path) for path in paths if path[-1] in in_neighbors]
-            for cycle in cycles_u:
-                add = True
-                for v in cycle[1:]:
-                    if v >= u_index:
-                        add = False
-                        break
-                if add:
-                    cycles += [cycle]
-    return sorted(cycles)
-
-
-def find_simple_paths_node(g: ig.Graph, u, k, path_dict=None, out_neigh=None):
-    paths_uk = path_dict.get((u, k), None)
-    if paths_uk is not None:
-        return paths_uk
-    if k == 0:
-        paths_uk = [[u]]
-    else:
-        paths_uk = []
-        for v in out_neigh[u]:
-            paths_vk = path_dict.get((v, k-1), None)
-            if paths_vk is None:
-                paths_vk = []
-                paths_vk += find_simple_paths_node(g, v, k-1, path_dict, out_neigh)
-            paths_uk += [[u]+p for p in paths_vk if u not in p]
-    path_dict[(u, k)] = paths_uk
-    return paths_uk
-
-
-def simple_cycles_limited_length(graph: ig.Graph, k, remaining_time=math.inf):  # adapted julia implementation
-    max_time = time.perf_counter()+remaining_time
-    cycles = []
-    if k < 1:
-        return cycles
-    cycle = [None]*k
-    out_neighs = [graph.neighbors(v, ig.OUT) for v in graph.vs]
-    for v in graph.vs:
-        if time.perf_counter() > max_time:
+            if writer is not None:
+                merge_segments(chunk_segments, stats, writer)
+            else:
+                segments += chunk_segments
+    finally:
+        pool.close()
+        pool.join()
+        shared_search = None
+
+    if writer is not None:
+        return writer.close()
+    segments.sort(key=lambda segment: segment[0])
+    return to_flat(*merge_segments(segments, stats))
+
+
+def merge_segments(segments, stats: CycleSearchStats = None, writer=None):
+    vertices = array("i")
+    lengths = array("i")
+    for root, root_vertices, root_lengths, result in segments:
+        vertices.extend(root_vertices)
+        lengths.extend(root_lengths)
+        if stats is not None:
+            stats.expanded[root], stats.pruned[root], stats.cycles[root] = result
+    if writer is not None:
+        writer.write(vertices, lengths)
+    return vertices, lengths
+
+
+def root_chunks(components: StrongComponents, num_chunks):
+    # Spread the roots over the chunks greedily, heaviest first, and hand out the heaviest chunks first. Roots outside
+    # the nontrivial components are not searched at all.
+    estimate = components.search_estimates()
+    roots = np.flatnonzero(components.component_of >= 0)
+    num_chunks = max(min(num_chunks, len(roots)), 1)
+    heap = [(0, i) for i in range(num_chunks)]
+    chunks = [[] for _ in range(num_chunks)]
+    for root in roots[np.argsort(-estimate[roots], kind="stable")].tolist():
+        load, i = heapq.heappop(heap)
+        chunks[i].append(root)
+        heapq.heappush(heap, (load+int(estimate[root]), i))
+    loads = sorted(heap, reverse=True)
+    return [chunks[i] for _, i in loads if chunks[i]]
+
+
+def search_chunk(roots):
+    components, searchers = shared_search
+    segments = []
+    for root in roots:
+        c = int(components.component_of[root])
+        searcher = searchers[c]
+        if time.perf_counter() > searcher.deadline:
             return None
-        cycle[0] = v.index
-        status = simple_cycles_limited_length_node(graph, k, cycles, cycle, 0, out_neighs)
-        if status == -1:
+        local_vertices = array("i")
+        lengths = array("i")
+        result = searcher.search(int(components.local_ids[root]), local_vertices, lengths)
+        if result is None:
             return None
-    return sorted(cycles)
-
-
-def simple_cycles_limited_length_node(graph: ig.Graph, k, cycles, cycle, i, out_neighs):
-    neighbors = out_neighs[cycle[i]]
-    repeated = False
-    for v in neighbors:
-        if v == cycle[0] and not repeated:
-            cycles.append(cycle[:i+1])
-            repeated = True
-        elif i < k-1 and v > cycle[0] and not repeated_vertex(v, cycle, 1, i):
-            cycle[i+1] = v
-            simple_cycles_limited_length_node(graph, k, cycles, cycle, i+1, out_neighs)
-    return 0
-
-
-def simple_cycles_parallel(graph: ig.Graph, k):
-    if k < 1:
-        return []
-    out_neighs = [graph.neighbors(v, ig.OUT) for v in graph.vs]
-    input_list = [None]*graph.vcount()
-    for v in graph.vs:
-        cycle = [None]*k
-        cycle[0] = v.index
-        input_list[v.index] = [graph, k, [], cycle, 0, out_neighs]
-    cycles_node = from_list(simple_cycles_parallel_node, input_list)
-    cycles = list()
-    for e in cycles_node:
-        cycles.extend(e)
-    return sorted(cycles)
-
-
-def simple_cycles_parallel_node(graph: ig.Graph, k, cycles, cycle, i, out_neighs):
-    neighbors = out_neighs[cycle[i]]
-    repeated = False
-    for v in neighbors:
-        if v == cycle[0] and not repeated:
-            cycles.append(cycle[:i+1])
-            repeated = True
-        elif i < k-1 and v > cycle[0] and not repeated_vertex(v, cycle, 1, i):
-            cycle[i+1] = v
-            simple_cycles_parallel_node(graph, k, cycles, cycle, i+1, out_neighs)
-    return cycles
-
-
-def repeated_vertex(v, cycle, n1, n2):
-    for k in range(n1, n2+1):
-        if cycle[k] == v:
-            return True
-    return False
-
-
-def find_recipients(graph: ig.Graph, x_val: dict):
-    recipients = [-1]*graph.vcount()
-    for e, value in x_val.items():
-        i = e[0]
-        j = e[1]
-        if value > 1/2:
-            recipients[i] = j
-    return recipients
+        segments.append((root, components.to_global(c, local_vertices), lengths, result))
+    return segments
+
+
+def chain_edges(out_neighbors, ndd, max_length, is_ndd):
+    # Breadth-first search from an NDD, up to max_length hops. Only the edges leaving a vertex at most max_length-1
+    # hops away can be at some position of a chain of at most max_length edges. Chains never enter another NDD.
+    reached = {ndd}
+    frontier = [ndd]
+    edges = []
+    for _ in range(max_length):
+        next_frontier = []
+        for u in frontier:
+            for v in out_neighbors[u]:
+                if v in is_ndd:
+                    continue
+                edges.append((u, v))
+                if v not in reached:
+                    reached.add(v)
+                    next_frontier.append(v)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    return edges, sorted(reached)
+
+
+def chain_distances(graph, ndds, max_length, is_ndd):
+    # Hops from the closest NDD, up to max_length, without passing through another NDD. Vertices further away keep
+    # max_length+1 (and NDDs 0).
+    n = graph.vcount()
+    indptr, indices = adjacency_csr(graph)
+    dist = np.full(n, max_length+1, dtype=np.int64)
+    dist[ndds] = 0
+    frontier = np.asarray(ndds, dtype=np.int64)
+    for d in range(1, max_length+1):
+        if len(frontier) == 0:
+            break
+        starts, ends = indptr[frontier].tolist(), indptr[frontier+1].tolist()
+        neighbors = np.unique(np.concatenate([indices[s:e] for s, e in zip(starts, ends)]))
+        neighbors = neighbors[(dist[neighbors] > d) & ~is_ndd[neighbors]]
+        dist[neighbors] = d
+        frontier = neighbors
+    return dist
+
+
+def find_successors(n, x_val: dict):
+    # the recipient of every vertex on the edges with value over 1/2, -1 if it has none
+    successors = np.full(n, -1, dtype=np.int64)
+    values = np.fromiter(x_val.values(), dtype=float, count=len(x_val))
+    chosen = np.flatnonzero(values > 1/2).tolist()
+    if chosen:
+        keys = list(x_val)
+        edges = np.array([keys[e] for e in chosen], dtype=np.int64)
+        successors[edges[:, 0]] = edges[:, 1]
+    return successors
+
+
+def decode_successors(successors):
+    # The chains of a successor array, from their vertex without a predecessor, and its cycles, from their lowest
+    # vertex, in the order of that first vertex. Returns the vertices of all of them as one flat array with offsets,
+    # and which of them are cycles.
+    n = len(successors)
+    matched = successors >= 0
+    has_predecessor = np.zeros(n, dtype=bool)
+    has_predecessor[successors[matched]] = True
+    heads = np.flatnonzero(matched & ~has_predecessor)
+
+    # the lowest vertex of every cycle by pointer jumping, over twice as many successors in every round, after which
+    # the vertices inside chains have jumped to the end of their chain
+    inner = matched & has_predecessor
+    lowest = np.arange(n)
+    jump = np.where(inner, successors, lowest)
+    for _ in range(max(n-1, 1).bit_length()):
+        lowest = np.minimum(lowest, lowest[jump])
+        jump = jump[jump]
+    in_cycle = inner & inner[jump]
+    starts = np.concatenate((heads, np.flatnonzero(in_cycle & (lowest == np.arange(n)))))
+    is_cycle = np.arange(len(starts)) >= len(heads)
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    is_cycle = is_cycle[order]
+
+    # all of them walked at once, one vertex further in every step, until the end of a chain or back at the start
+    steps = [starts]
+    ids = [np.arange(len(starts))]
+    current, current_ids = starts, ids[0]
+    for _ in range(n):
+        current = successors[current]
+        alive = current >= 0
+        alive[alive] = current[alive] != starts[current_ids[alive]]
+        current, current_ids = current[alive], current_ids[alive]
+        if len(current) == 0:
+            break
+        steps.append(current)
+        ids.append(current_ids)
+    ids = np.concatenate(ids)
+    vertices = np.concatenate(steps)[np.argsort(ids, kind="stable")]
+    offsets = np.zeros(len(starts)+1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=len(starts)), out=offsets[1:])
+    return vertices, offsets, is_cycle
 
 
 def main():
@@ -133,15 +440,15 @@ def main():
     k = 4
     g = ig.Graph.Erdos_Renyi(n, m=m, directed=True, loops=False)
 
-    implementations = [simple_cycles_parallel, simple_cycles_limited_length, find_cycles]
+    implementations = [simple_cycles_parallel, simple_cycles_flat]
 
     for f in implementations:
         print(f.__name__)
         t0 = time.perf_counter()
-        cycles = f(g, k)
+        vertices, offsets = f(g, k)
         tf = time.perf_counter()
         print(round(tf-t0, 3), 'sec')
-        print(len(cycles), 'cycles')
+        print(len(offsets)-1, 'cycles')
         print()
 
 
@@ -0,0 +1,293 @@
+import math
+import time
+
+import numpy as np
+
+from constants import callback_heuristic_time, eps, heuristic_cycle_length, heuristic_time_share
+from utils.cycle_store import CycleStore, cycle_successors
+from utils.edge_weights import EdgeWeights
+from utils.graph_utils import simple_cycles_flat
+from utils.transport import Input, Output, matched_value
+from utils.utils import get_remaining_time
+
+free = -1
+in_chain = -2
+
+
+class Heuristic:
+    """Disjoint cycles and chains found by greedy packing and local search, offered to the solvers as a starting
+    incumbent and returned instead of their solution when it is better.
+
+    The heaviest cycles are packed first, then chains are grown from the NDDs over the remaining patients, looking
+    one edge ahead. The improvement phase swaps a cycle in for the lighter cycles it overlaps and grows the tail of
+    every chain again from each of its positions, until neither helps or the time share runs out.
+
+    While solving, fractional points of the solver can be rounded into solutions the same way, starting from the
+    cycles and chain edges with the highest values instead, and replace the solution kept here when they are better.
+
+    When the input comes with a start solution, that solution is taken as it is instead, without packing or local
+    search, and without enumerating cycles when the formulation has none."""
+
+    def __init__(self, input_data: Input, cycles: CycleStore = None):
+        # cycles are the ones a formulation already enumerated, otherwise the short ones are enumerated here
+        self.graph = graph = input_data.graph
+        self.weights = input_data.weights
+        self.n = n = graph.vcount()
+        self.max_chain_length = min(input_data.chain_length, n-1) if len(input_data.ndds) else 0
+        self.deadline = time.perf_counter() + heuristic_time_share*get_remaining_time(input_data.start_time)
+        self.is_ndd = np.zeros(n, dtype=bool)
+        self.is_ndd[input_data.ndds] = True
+        self.forbidden = np.zeros(n, dtype=bool)
+        self.forbidden[list(input_data.forbidden_nodes or [])] = True
+        self.out_edges = [None]*n
+
+        start = input_data.start
+        if cycles is None and start is not None:
+            cycles = CycleStore(n, *flat_cycles([vertices for kind, vertices in start if kind == "cycle"]),
+                                self.weights)
+        if cycles is None:
+            k = min(input_data.cycle_length, heuristic_cycle_length, n-len(input_data.ndds))
+            result = simple_cycles_flat(graph, k, max(self.deadline-time.perf_counter(), 0))
+            if result is None:
+                result = np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64)
+            cycles = CycleStore(n, *result, self.weights)
+        self.store = cycles
+        self.order = np.lexsort((cycles.lengths, -cycles.weights))  # heaviest first, then shortest
+
+        self.owner = np.full(n, free, dtype=np.int64)  # cycle id, in_chain or free
+        self.cycle_ids = []
+        self.chains = []
+        if start is not None:
+            self.set_solution(start)
+            self.value = self.solution_value()
+            return
+        self.pack_cycles()
+        self.grow_chains()
+        self.improve()
+        self.value = self.solution_value()
+        print("Heuristic solution of value %s with %s cycles and %s chains"
+              % (round(self.value, 5), len(self.cycle_ids), len(self.chains)))
+
+    def set_solution(self, start):
+        # cycles not found in the store, which can only be missing after a search that timed out, are left out
+        for kind, vertices in start:
+            if kind == "chain":
+                self.chains.append(list(vertices))
+                self.owner[vertices] = in_chain
+                continue
+            c = self.find_cycle(list(vertices))
+            if c is not None:
+                self.owner[vertices] = c
+                self.cycle_ids.append(c)
+
+    def find_cycle(self, vertices):
+        lowest = vertices.index(min(vertices))
+        vertices = vertices[lowest:] + vertices[:lowest]
+        for c in self.store.cycles_of(vertices[0]).tolist():
+            cycle = self.store.cycle(c)
+            lowest = cycle.index(vertices[0])
+            if len(cycle) == len(vertices) and cycle[lowest:] + cycle[:lowest] == vertices:
+                return c
+        return None
+
+    def solution_value(self):
+        return float(self.store.weights[self.cycle_ids].sum()) + sum(map(self.chain_weight, self.chains))
+
+    def timed_out(self):
+        return time.perf_counter() > self.deadline
+
+    def edges_from(self, v):
+        if self.out_edges[v] is None:
+            indices, data = self.weights.row(v)
+            self.out_edges[v] = list(zip(indices.tolist(), data.tolist()))
+        return self.out_edges[v]
+
+    def pack_cycles(self):
+        for count, c in enumerate(self.order.tolist()):
+            if count % 1024 == 0 and self.timed_out():
+                return
+            self.try_cycle(c)
+
+    def try_cycle(self, c):
+        # takes cycle c if it only overlaps lighter cycles, which are dropped
+        vertices = self.store.cycle(c)
+        owners = set(self.owner[vertices].tolist())
+        owners.discard(free)
+        if in_chain in owners or c in owners:
+            return False
+        if owners and self.store.weights[c] <= self.store.weights[list(owners)].sum() + eps:
+            return False
+        for other in owners:
+            self.owner[self.store[other]] = free
+            self.cycle_ids.remove(other)
+        self.owner[vertices] = c
+        self.cycle_ids.append(c)
+        return True
+
+    def grow_chains(self):
+        if self.max_chain_length == 0:
+            return
+        for ndd in np.flatnonzero(self.is_ndd).tolist():
+            chain = self.extend([ndd])
+            if len(chain) > 1:
+                self.chains.append(chain)
+
+    def is_open(self, v):
+        return self.owner[v] == free and not self.is_ndd[v]
+
+    def extend(self, chain):
+        # grows chain from its last vertex by the edge with the best weight over the next two edges
+        self.owner[chain] = in_chain
+        while len(chain) <= self.max_chain_length:
+            last_edge = len(chain) == self.max_chain_length
+            best, best_score = None, eps
+            for j, w in self.edges_from(chain[-1]):
+                if not self.is_open(j):
+                    continue
+                score = w
+                if not last_edge:
+                    score += max([w2 for k, w2 in self.edges_from(j) if k != j and self.is_open(k)], default=0)
+                if score > best_score:
+                    best, best_score = j, score
+            if best is None:
+                break
+            chain.append(best)
+            self.owner[best] = in_chain
+        while len(chain) > 1 and self.forbidden[chain[-1]]:  # a forbidden patient cannot end a chain
+            self.owner[chain.pop()] = free
+        return chain
+
+    def chain_weight(self, chain):
+        return sum(self.weights[i, j] for i, j in zip(chain, chain[1:]))
+
+    def improve(self):
+        improved = True
+        while improved and not self.timed_out():
+            improved = False
+            for count, c in enumerate(self.order.tolist()):
+                if count % 1024 == 0 and self.timed_out():
+                    return
+                if self.owner[self.store[c][0]] != c:
+                    improved |= self.try_cycle(c)
+            improved |= self.regrow_chains()
+
+    def regrow_chains(self):
+        improved = False
+        for ndd in np.flatnonzero(self.is_ndd).tolist():
+            if self.max_chain_length == 0 or self.timed_out():
+                break
+            chains = [chain for chain in self.chains if chain[0] == ndd]
+            chain = chains[0] if chains else [ndd]
+            weight = self.chain_weight(chain)
+            for cut in range(len(chain), 0, -1):
+                self.owner[chain[cut:]] = free
+                new_chain = self.extend(chain[:cut])
+                if self.chain_weight(new_chain) > weight + eps:
+                    chain, weight = new_chain, self.chain_weight(new_chain)
+                    improved = True
+                else:
+                    self.owner[new_chain] = free
+                    self.owner[chain] = in_chain
+            if chains:
+                self.chains.remove(chains[0])
+            if len(chain) > 1:
+                self.chains.append(chain)
+            else:
+                self.owner[chain] = free
+        return improved
+
+    def round_point(self, edge_values, cycle_values=None, time_limit=0.) -> bool:
+        # Edge values by edge id, and cycle values by cycle of the store, or the lowest value of their edges if not
+        # given. Tells if the rounded solution was better and replaced the one kept.
+        values = EdgeWeights(self.n, self.weights.origins, self.weights.destinations, edge_values)
+        if cycle_values is None:
+            cycle_values = self.lowest_edge_values(values)
+        kept = self.owner.copy(), self.cycle_ids, self.chains
+        self.deadline = time.perf_counter() + time_limit
+        self.owner[:] = free
+        self.cycle_ids = []
+        self.chains = []
+
+        chosen = np.flatnonzero(cycle_values > 1/2)
+        for c in chosen[np.argsort(-cycle_values[chosen], kind="stable")].tolist():
+            vertices = self.store[c]
+            if (self.owner[vertices] == free).all():
+                self.owner[vertices] = c
+                self.cycle_ids.append(c)
+        if self.max_chain_length > 0:
+            for ndd in np.flatnonzero(self.is_ndd).tolist():
+                chain = self.extend(self.follow([ndd], values))
+                if len(chain) > 1:
+                    self.chains.append(chain)
+        self.pack_cycles()
+        self.improve()
+
+        value = self.solution_value()
+        if value > self.value + eps:
+            self.value = value
+            return True
+        self.owner, self.cycle_ids, self.chains = kept
+        return False
+
+    def lowest_edge_values(self, values: EdgeWeights):
+        lowest = np.zeros(len(self.store), dtype=float)
+        for start, end, vertices, offsets in self.store.batches():
+            if end > start:
+                edge_values = values.lookup(vertices, cycle_successors(vertices, offsets))
+                lowest[start:end] = np.minimum.reduceat(edge_values, offsets[:-1])
+        return lowest
+
+    def follow(self, chain, values: EdgeWeights):
+        # extends chain along the open edge with the highest value while there is one
+        self.owner[chain] = in_chain
+        while len(chain) <= self.max_chain_length:
+            indices, data = values.row(chain[-1])
+            best, best_value = None, eps
+            for j, value in zip(indices.tolist(), data.tolist()):
+                if value > best_value and self.is_open(j):
+                    best, best_value = j, value
+            if best is None:
+                break
+            chain.append(best)
+            self.owner[best] = in_chain
+        return chain
+
+    def cycles(self, max_cycle_length=math.inf):
+        cycles = [self.store.cycle(c) for c in self.cycle_ids]
+        return [cycle for cycle in cycles if len(cycle) <= max_cycle_length]
+
+    def cycle_edge_set(self, max_cycle_length=math.inf):
+        return {e for cycle in self.cycles(max_cycle_length) for e in zip(cycle, cycle[1:]+cycle[:1])}
+
+    def chain_edge_lists(self):
+        # the edges of every chain in order, by NDD
+        return {chain[0]: list(zip(chain, chain[1:])) for chain in self.chains}
+
+    def output(self, max_cycle_length=math.inf, bound=math.inf) -> Output:
+        # the solution in the format of Basic, with the cycles over max_cycle_length left out
+        chosen = self.cycle_edge_set(max_cycle_length)
+        chosen.update(e for chain in self.chain_edge_lists().values() for e in chain)
+        match_edges = {e.tuple: float(e.tuple in chosen) for e in self.graph.es}
+        value = matched_value(match_edges, None, self.weights)
+        return Output(match_edges, None, None, value, False, bound)
+
+
+def best_output(output: {Output, None}, heuristic: {Heuristic, None}, max_cycle_length, bound=math.inf):
+    # the solution found by the solver or the heuristic one, whichever is better, with the bound of the solver
+    if heuristic is None:
+        return output
+    heuristic_output = heuristic.output(max_cycle_length, bound)
+    if output is None or heuristic_output.value > output.value + eps:
+        return heuristic_output
+    return output
+
+
+def flat_cycles(cycles):
+    offsets = np.zeros(len(cycles)+1, dtype=np.int64)
+    np.cumsum([len(cycle) for cycle in cycles], out=offsets[1:])
+    vertices = np.array([v for cycle in cycles for v in cycle], dtype=np.int32)
+    return vertices, offsets
+
+
+def rounding_time(start_time):
+    return min(callback_heuristic_time, heuristic_time_share*get_remaining_time(start_time))
@@ -0,0 +1,64 @@
+import copy
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from constants import eps
+from utils.edge_weights import EdgeWeights
+from utils.transport import Output, get_match_list
+
+
+class Progress:
+    """Appends every improving solution found while solving to a JSON-lines file, one object per line with the elapsed
+    time, the objective, the bound and the cycles and chains as in the output file. The processes solving the same
+    problem share the best objective written so far, so only improvements are written. An entry with a component
+    number only covers that component of a decomposed instance, and replaces the previous entry of the component."""
+
+    def __init__(self, path, node_names: list):
+        self.path = path
+        self.node_names = node_names
+        self.start_time = time.perf_counter()
+        self.vertex_ids = None  # ids in the whole instance of the vertices of the problem being solved
+        self.component = None
+        self.best = mp.Value("d", -math.inf)  # shared with the processes forked to solve the problem
+        open(path, "w").close()
+
+    def restrict(self, members, component=None):
+        progress = copy.copy(self)
+        members = np.asarray(members)
+        progress.vertex_ids = members if self.vertex_ids is None else self.vertex_ids[members]
+        if component is not None:
+            progress.component = component
+            progress.best = mp.Value("d", -math.inf)
+        return progress
+
+    def improves(self, value: float) -> bool:
+        return value > self.best.value + eps
+
+    def report(self, output: Output, graph, weights: EdgeWeights):
+        # output, graph and weights in the vertex ids of the problem being solved
+        with self.best.get_lock():
+            if output.value <= self.best.value + eps:
+                return
+            self.best.value = output.value
+            cycles_chains = []
+            for kind, vertices, vertex_weights in get_match_list(output, graph, weights):
+                if self.vertex_ids is not None:
+                    vertices = self.vertex_ids[vertices].tolist()
+                cycles_chains.append([kind, [self.node_names[v] for v in vertices], vertex_weights])
+            entry = {"time": round(time.perf_counter() - self.start_time, 3)}
+            if self.component is not None:
+                entry["component"] = self.component
+            entry["objective"] = output.value
+            entry["bound"] = output.bound if math.isfinite(output.bound) else None
+            entry["cycles_chains"] = cycles_chains
+            line = json.dumps(entry) + "\n"
+            file = os.open(self.path, os.O_WRONLY | os.O_APPEND)  # one write per line, so processes do not interleave
+            try:
+                os.write(file, line.encode())
+            finally:
+                os.close(file)
@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+
+from utils.graph_utils import adjacency_csr, chain_distances, neighbor_lists
+from utils.transport import Input, restrict_input
+from utils.utils import get_remaining_time
+
+time_share = 0.1  # share of the remaining time the cycle test may use, afterwards edges inside components are kept
+
+
+def reduce_input(input_data: Input):
+    # Keeps the edges that can be in a cycle of at most cycle_length edges or in a chain of at most chain_length
+    # edges, and the vertices with at least one kept edge. Returns None when nothing can be removed.
+    graph = input_data.graph
+    weights = input_data.weights
+    n = graph.vcount()
+    is_ndd = np.zeros(n, dtype=bool)
+    is_ndd[input_data.ndds] = True
+
+    cycle_pairs = cycle_edges(input_data, is_ndd)
+    max_chain_length = min(input_data.chain_length, n)
+    chain_dist = chain_distances(graph, input_data.ndds, max_chain_length, is_ndd)
+    keys = weights.origins.astype(np.int64)*n + weights.destinations
+    keep = np.isin(keys, cycle_pairs)
+    keep |= chain_dist[weights.origins] < max_chain_length
+    keep &= ~is_ndd[weights.destinations]
+    edge_ids = np.flatnonzero(keep)
+
+    used = np.zeros(n, dtype=bool)
+    used[weights.origins[edge_ids]] = True
+    used[weights.destinations[edge_ids]] = True
+    members = np.concatenate((np.flatnonzero(used & is_ndd), np.flatnonzero(used & ~is_ndd)))
+    print("Graph reduction: removed %s of %s vertices and %s of %s edges"
+          % (n-len(members), n, len(weights)-len(edge_ids), len(weights)))
+    if len(members) == n and len(edge_ids) == len(weights):
+        return None
+    return restrict_input(input_data, members, edge_ids)
+
+
+def cycle_edges(input_data: Input, is_ndd):
+    # An edge (i, j) closes a cycle of at most k edges when i can be reached from j in k-1 edges. The search only
+    # follows edges inside strongly connected components, and if it runs out of time, every such edge is kept.
+    graph = input_data.graph
+    n = graph.vcount()
+    k = min(input_data.cycle_length, n)
+    if k < 1:
+        return np.zeros(0, dtype=np.int64)
+    deadline = time.perf_counter() + time_share*get_remaining_time(input_data.start_time)
+    membership = np.array(graph.connected_components(mode="strong").membership, dtype=np.int64).reshape(-1)
+    indptr, indices = adjacency_csr(graph)
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    inside = (membership[sources] == membership[indices]) & ~is_ndd[sources] & ~is_ndd[indices]
+    keys = sources[inside]*n + indices[inside]
+    if k >= n:
+        return keys
+
+    inside_indptr = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(sources[inside], minlength=n), out=inside_indptr[1:])
+    out_neighs, in_neighs = neighbor_lists(n, inside_indptr, indices[inside])
+    pairs = []
+    dist = [k]*n
+    for j in range(n):
+        if not in_neighs[j]:
+            continue
+        if time.perf_counter() > deadline:
+            return keys
+        dist[j] = 0
+        reached = [j]
+        frontier = [j]
+        for d in range(1, k):
+            next_frontier = []
+            for u in frontier:
+                for w in out_neighs[u]:
+                    if dist[w] > d:
+                        dist[w] = d
+                        next_frontier.append(w)
+            reached += next_frontier
+            frontier = next_frontier
+        pairs += [i*n + j for i in in_neighs[j] if dist[i] < k]
+        for u in reached:
+            dist[u] = k
+    return np.array(pairs, dtype=np.int64)
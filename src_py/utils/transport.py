@@ -2,12 +2,17 @@ from typing import List, Dict, Tuple
 import igraph as ig
 import numpy as np
 
+from utils.cycle_store import CycleStore, cycle_successors
+from utils.edge_weights import EdgeWeights
+from utils.graph_utils import decode_successors, find_successors
+from utils.utils import relative_gap
+
 
 class Input:
     def __init__(
             self,
             graph: ig.Graph,
-            weights: np.ndarray,
+            weights: EdgeWeights,
             ndds: List[int],
             cycle_length: int,
             chain_length: int,
@@ -20,6 +25,9 @@ class Input:
         self.chain_length = chain_length
         self.solver_instance = None
         self.start_time = None
+        self.progress = None  # receives the solutions found while solving, see utils.progress
+        self.start = None  # (kind, vertices) of cycles and chains the heuristic starts from instead of packing its own
+        self.processes = None  # cores for the processes forked to solve it, None for all, shared out by nested levels
 
         self.forbidden_nodes = forbidden_nodes
 
@@ -29,13 +37,116 @@ class Output:
             self,
             match_edges: Dict[Tuple[int], float],
             match_cycles: {Dict[int, float], None},
-            graph_cycles: {List[Tuple[int]], None},
+            graph_cycles: {CycleStore, None},
             value: float,
             optimal: bool,
+            bound: float = None,
             ):
         self.match_edges = match_edges
         self.match_cycles = match_cycles
         self.graph_cycles = graph_cycles
         self.value = value
         self.optimal = optimal
+        self.bound = value if bound is None else bound  # a solution found by the deadline comes with its bound
         self.time = -1
+
+    @property
+    def gap(self):
+        return relative_gap(self.value, self.bound)
+
+
+def restrict_input(input_data: Input, members, edge_ids, component=None):
+    # Subproblem over the given vertices and edge ids, renumbered in the order of members, which must list the NDDs
+    # first so they keep the ids 0..len(ndds)-1 the formulations expect. Returns members, to map the solution back.
+    # component numbers the subproblem when it is one of several solved separately.
+    weights = input_data.weights
+    members = np.asarray(members, dtype=np.int32)
+    order = np.argsort(members)
+    origins = order[np.searchsorted(members, weights.origins[edge_ids], sorter=order)]
+    destinations = order[np.searchsorted(members, weights.destinations[edge_ids], sorter=order)]
+    graph = ig.Graph(n=len(members), edges=np.column_stack((origins, destinations)).tolist(), directed=True)
+    sub_input = Input(
+        graph,
+        EdgeWeights(len(members), origins, destinations, weights.values[edge_ids]),
+        np.flatnonzero(np.isin(members, input_data.ndds)).tolist(),
+        input_data.cycle_length,
+        input_data.chain_length,
+        np.flatnonzero(np.isin(members, input_data.forbidden_nodes)).tolist(),
+    )
+    sub_input.solver_instance = input_data.solver_instance
+    sub_input.start_time = input_data.start_time
+    sub_input.processes = input_data.processes
+    if input_data.progress is not None:
+        sub_input.progress = input_data.progress.restrict(members, component)
+    return members, sub_input
+
+
+def merge_outputs(parts, input_data: Input):
+    # parts holds (members, output) pairs, with every output in the vertex ids of its restricted input
+    match_edges = dict()
+    cycles = []
+    cycle_values = []
+    has_cycles = False
+    for members, output in parts:
+        for (i, j), value in output.match_edges.items():
+            match_edges[(int(members[i]), int(members[j]))] = value
+        if output.match_cycles is None:
+            continue
+        has_cycles = True
+        for i, value in output.match_cycles.items():
+            cycles.append(members[output.graph_cycles[i]])
+            cycle_values.append(value)
+
+    match_cycles = None
+    graph_cycles = None
+    if has_cycles:
+        offsets = np.zeros(len(cycles)+1, dtype=np.int64)
+        np.cumsum([len(cycle) for cycle in cycles], out=offsets[1:])
+        vertices = np.concatenate(cycles) if cycles else np.zeros(0, dtype=np.int32)
+        match_cycles = dict(enumerate(cycle_values))
+        graph_cycles = CycleStore(input_data.graph.vcount(), vertices, offsets, input_data.weights)
+    value = sum(output.value for _, output in parts)
+    optimal = all(output.optimal for _, output in parts)
+    bound = sum(output.bound for _, output in parts)
+    return Output(match_edges, match_cycles, graph_cycles, value, optimal, bound)
+
+
+def matched_value(match_edges: dict, graph_cycles: {CycleStore, None}, weights: EdgeWeights):
+    value = sum(weights[e] for e, x in match_edges.items() if x > 1/2)
+    if graph_cycles is not None:
+        value += float(graph_cycles.weights.sum())
+    return value
+
+
+def get_match_list(output_data: Output, graph: ig.Graph, weights: EdgeWeights):
+    match_cycles = output_data.match_cycles
+    graph_cycles = output_data.graph_cycles
+
+    successors = find_successors(graph.vcount(), output_data.match_edges)
+    vertices, offsets, is_cycle = decode_successors(successors)
+    # the weight of the edge leaving every vertex, none for the last vertex of a chain
+    next_vertices = successors[vertices]
+    has_next = next_vertices >= 0
+    vertex_weights = np.zeros(len(vertices), dtype=float)
+    vertex_weights[has_next] = weights.lookup(vertices[has_next], next_vertices[has_next])
+    vertices = vertices.tolist()
+    vertex_weights = vertex_weights.tolist()
+    offsets = offsets.tolist()
+    cycle_chains_list = []
+    for s, cycle in enumerate(is_cycle.tolist()):
+        start, end = offsets[s], offsets[s+1]
+        if cycle:
+            cycle_chains_list.append(("cycle", vertices[start:end], vertex_weights[start:end]))
+        else:
+            cycle_chains_list.append(("chain", vertices[start:end], vertex_weights[start:end-1] + [0]))
+    if match_cycles is not None and len(graph_cycles) > 0:
+        cycle_vertices = np.asarray(graph_cycles.vertices)
+        cycle_offsets = np.asarray(graph_cycles.offsets)
+        cycle_weights = weights.lookup(cycle_vertices, cycle_successors(cycle_vertices, cycle_offsets)).tolist()
+        cycle_vertices = cycle_vertices.tolist()
+        cycle_offsets = cycle_offsets.tolist()
+        for i, value in match_cycles.items():
+            if value > 1/2:
+                start, end = cycle_offsets[i], cycle_offsets[i+1]
+                cycle_chains_list.append(("cycle", cycle_vertices[start:end], cycle_weights[start:end]))
+    return cycle_chains_list
@@ -1,6 +1,7 @@
+import multiprocessing as mp
 import time
 
-from constants import timeout
+from constants import eps, timeout
 
 
 def get_remaining_time(start_time):
@@ -8,5 +9,25 @@ def get_remaining_time(start_time):
     return max(timeout - elapsed_time, 0)
 
 
+def get_start_time(time_limit):
+    # start time for which get_remaining_time leaves time_limit seconds
+    return time.perf_counter() - timeout + time_limit
+
+
+def process_budget(input_data, processes=None):
+    # processes asked for (None for all the cores), at most the cores left to input_data by the processes above it
+    cores = input_data.processes or mp.cpu_count()
+    return min(processes or cores, cores)
+
+
+def relative_gap(value, bound):
+    return max(bound - value, 0) / max(abs(value), eps)
+
+
 def setdiff(a, b):
     return list(set(a).difference(b))
+
+
+def print_chain_pruning(kept, total):
+    print("Chain variables: kept %s of %s NDD edge copies, dropped %s unreachable within the chain length"
+          % (kept, total, total-kept))